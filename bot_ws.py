@@ -1,21 +1,27 @@
 #!/usr/bin/env python3
 from __future__ import print_function
 
+import time
+# Process start, for the startup timing breakdown
+_STARTED = time.monotonic()
+
 import asyncio
-from base64 import b64encode
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import json
 import os
+import re
 import secrets
 import signal
 import sys
-from time import time
+import threading
 import uuid
 from dotenv import load_dotenv
 from pathlib import Path
 import websockets
 
-from webex_admin import WebexAdmin
+from webex_admin import AsyncWebexAdmin, group_devices_by_workspace
 import webex_admin
 
 load_dotenv()
@@ -23,25 +29,68 @@ from websockets.exceptions import ConnectionClosed, ConnectionClosedError
 
 from webexteamssdk import WebexTeamsAPI, ApiError
 import helper
+from cache import TTLCache
+from dispatcher import EventDispatcher
+from membership_cache import MembershipCache
+from messenger import OutboundMessenger
 from oauth_manager import OAuthManager
+from rate_limiter import RateLimitedAdapter
+from saver import BackgroundSaver
+from sqlite_storage_manager import SQLiteStorageManager
 from storage_manager import StorageManager
+from token_manager import TokenManager
 import webex_utils
 
+_IMPORT_SECONDS = time.monotonic() - _STARTED
+
+# Cheap classification of raw websocket frames, so only frames the bot acts on are decoded
+_EVENT_TYPE_RE = re.compile(r'"eventType"\s*:\s*"([^"]*)"')
+_HANDLED_ACTIVITY_RE = re.compile(r'"verb"\s*:\s*"(?:post|cardAction|add|leave)"')
+
 class BotWS:
 
     def __init__(self, bot_token, storage: StorageManager):
         self.bot_token = bot_token
+        self.startup_timings: dict[str, float] = {"imports": _IMPORT_SECONDS}
+        # The WDM device lookup is independent of everything else, run it while the bot resolves its identity
+        startup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup")
+        self._device_info_future = startup_executor.submit(
+            self._timed, "device", webex_utils.get_device_info, self.bot_token
+        )
+        startup_executor.shutdown(wait=False)
         self.api = WebexTeamsAPI(access_token=self.bot_token)
+        # The SDK already waits on 429s, the adapter paces the bot token's requests so they are rare.
+        # webexteamssdk has no public hook for this, the adapter goes on its private requests session
+        # (RestSession._req_session, as of 1.7); refuse to start rather than run unpaced after an upgrade.
+        req_session = getattr(getattr(self.api, "_session", None), "_req_session", None)
+        if not callable(getattr(req_session, "mount", None)):
+            raise RuntimeError(
+                "webexteamssdk no longer exposes _session._req_session, cannot rate limit the bot token"
+            )
+        req_session.mount("https://", RateLimitedAdapter(webex_admin.rate_limiter, "bot"))
         self.storage = storage
+        # Replies are queued and posted per room in batches
+        self.messenger = OutboundMessenger(
+            self.api,
+            window=float(os.getenv("MESSAGE_BATCH_WINDOW", "0.5")),
+            max_workers=int(os.getenv("MESSAGE_WORKERS", "4")),
+            rejection_interval=float(os.getenv("REJECTION_NOTICE_INTERVAL", "300"))
+        )
+        # Changes are marked dirty in storage and written by this saver in batches
+        self.saver = BackgroundSaver(
+            self.storage.save,
+            delay=float(os.getenv("SAVE_DELAY", "2"))
+        )
         
-        me = self.api.people.me()
+        me = self._timed("identity", self.api.people.me)
         self.bot_name = me.displayName
         self.bot_email = me.emails[0] if me.emails else ""
         self.bot_id = me.id
-        my_memberships = self.api.memberships.list(personId=self.bot_id)
-        self.my_memberships = list(my_memberships)
-        for membership in self.my_memberships:
-            self.get_or_create_room(membership.roomId)
+        # Rooms are reconciled with the bot's memberships in the background once running,
+        # rooms it joined while offline are hydrated on their first event
+        self._unhydrated_rooms: set[str] = set()
+        self._rooms_reconciled = False
+        self._rooms_lock = threading.Lock()
         self.active_auth_requests = {}
 
         @staticmethod
@@ -53,6 +102,34 @@ class BotWS:
         self.running = False
         self._pending_reinits = set()
         self.loop = None
+        self.dispatcher = EventDispatcher(
+            max_workers=int(os.getenv("DISPATCH_WORKERS", "8")),
+            slow_threshold=float(os.getenv("DISPATCH_SLOW_THRESHOLD", "5"))
+        )
+        # Resolved admin clients per org, so warm commands skip people.me() and organizations.get()
+        self._admin_contexts = TTLCache(ttl=float(os.getenv("ADMIN_CONTEXT_TTL", "3600")))
+        self._activity_handlers = {
+            "post": self._handle_message_event,
+            "cardAction": self._handle_card_event,
+            "add": self._handle_membership_add_event,
+            "leave": self._handle_membership_leave_event,
+        }
+        # Activity IDs handled recently, Mercury may redeliver them after a reconnect
+        self._seen_activities = TTLCache(
+            ttl=float(os.getenv("ACTIVITY_DEDUP_WINDOW", "900")),
+            max_size=int(os.getenv("ACTIVITY_DEDUP_SIZE", "10000"))
+        )
+        dedup_file = os.getenv("ACTIVITY_DEDUP_FILE", "")
+        self._seen_activities_location = Path(dedup_file) if dedup_file else None
+        self._load_seen_activities()
+        # Event counters, e.g. message fetches avoided by the pre-filter
+        self.event_counts = Counter()
+        self._event_counts_lock = threading.Lock()
+        # Email <-> person ID per room, dropped when the room's membership changes
+        self.members = MembershipCache(
+            ttl=float(os.getenv("MEMBERSHIP_CACHE_TTL", "900")),
+            max_rooms=int(os.getenv("MEMBERSHIP_CACHE_ROOMS", "1000"))
+        )
         
         OAUTH_CLIENT_ID = os.getenv("OAUTH_CLIENT_ID")
         OAUTH_CLIENT_SECRET = os.getenv("OAUTH_CLIENT_SECRET")
@@ -69,12 +146,15 @@ class BotWS:
             tokens_store_function = self.store_tokens
         )
         print(f"OAuth enabled: {OAUTH_REDIRECT_URI}")
+        self.tokens = TokenManager(
+            refresh_function=self.oauth.refresh_tokens,
+            save_function=self._org_tokens_changed,
+            refresh_margin=float(os.getenv("TOKEN_REFRESH_MARGIN", "21600"))
+        )
         
     def code_card(self, room) -> helper.AdaptiveCard:
-        webex_admin = WebexAdmin(
-            my_token=self.get_valid_token_for_room(room)
-        )
-        workspaces = webex_admin.list_workspaces_with_devices()
+        webex_admin = self._admin_for_room(room)
+        workspaces = self._run_coro(webex_admin.list_workspaces_with_devices())
         return helper.make_code_card(workspaces)
     
     def store_tokens(self, room_id: str, state: str, access_token: str, refresh_token: str, expires_at: datetime.datetime) -> None:
@@ -86,31 +166,43 @@ class BotWS:
         if auth_message_id:
             self.api.messages.delete(messageId=auth_message_id)
             self.active_auth_requests.pop(state, None)
-        webex_admin = WebexAdmin(
+        # Only validates the token, _admin_for_room builds the org's cached client with its refresher
+        webex_admin = self._run_coro(AsyncWebexAdmin.create(
             my_token=access_token
-        )
-        if not webex_admin.token_is_valid():
+        ))
+        if not self._run_coro(webex_admin.token_is_valid()):
             print("Error: Provided access token is not valid.")
-            self.api.messages.create(
-                roomId=room_id,
+            self.messenger.send(
+                room_id,
                 markdown=f"{webex_admin.name}({webex_admin.my_email}) doesn't have admin rights on organization **{webex_admin.org_name}** or the token is invalid.\nPlease try authorizing again."
             )
             self.does_room_manage_org(room_id)
             return
-        room['managed_org']['oauth_tokens'] = {
-            'access_token': access_token,
-            'refresh_token': refresh_token,
-            'expires_at': expires_at.isoformat()
-        }
-        room['managed_org']['org_id'] = webex_admin.org_id
-        room['managed_org']['org_name'] = webex_admin.org_name
-        self.api.messages.create(
-            roomId=room_id,
+        # Credentials are kept once per org and shared by every room linked to it
+        org = self.storage.set_org(webex_admin.org_id, webex_admin.org_name)
+        with self.storage.lock:
+            self.tokens.store(org, {
+                'access_token': access_token,
+                'refresh_token': refresh_token,
+                'expires_at': expires_at
+            })
+            room['managed_org'] = {'org_id': webex_admin.org_id}
+        self.storage.mark_room_dirty(room_id)
+        self.storage.mark_org_dirty(webex_admin.org_id)
+        self.storage.prune_orgs()
+        self.saver.request()
+        self.messenger.send(
+            room_id,
             markdown=f"Successfully authorized organization **{webex_admin.org_name}** with admin {webex_admin.name}({webex_admin.my_email}).  You can now request activation codes by saying *@{self.bot_name} hello*."
         )
-        self.storage.save()
         print(f"Stored tokens for room {room_id}")
 
+    def _run_coro(self, coro):
+        """Run a coroutine on the bot's event loop from a worker thread and wait for its result."""
+        if self.loop and self.loop.is_running():
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+        return asyncio.run(coro)
+
     def get_or_create_room(self, room_id: str) -> dict:
         room = self.storage.get_room(room_id)
         if not room:
@@ -118,19 +210,137 @@ class BotWS:
             if not room_details:
                 raise Exception(f"Failed to get room details for room {room_id}")
             room = self.storage.add_room(room_id, room_details.title)
+            self.saver.request()
             if room_details.type == "direct":
                 creator = self.api.people.get(room_details.creatorId)
                 room_admin_email = creator.emails[0] if creator.emails else ""
                 self.set_room_admin(room_id, room_admin_email, quiet=True)
         return room
     
+    def _reconcile_rooms(self) -> None:
+        """Diff stored rooms against the bot's memberships in one pass.
+
+        Rooms the bot has left are removed, new rooms are left for `_room_for_event`.
+        """
+        # Taken before listing, rooms stored while the listing pages in must not look left
+        stored = {room['room_id'] for room in self.storage.get_rooms()}
+        try:
+            member_of = {m.roomId for m in self.api.memberships.list(personId=self.bot_id, max=1000)}
+        except ApiError as e:
+            # Unknown rooms keep being hydrated on demand
+            print(f"Could not list memberships to reconcile rooms: {e}")
+            return
+        left = stored - member_of
+        for room_id in left:
+            self.storage.remove_room(room_id)
+            self.members.invalidate(room_id)
+        if left:
+            self.storage.prune_orgs()
+            self.saver.request()
+        with self._rooms_lock:
+            self._unhydrated_rooms = member_of - stored
+            self._rooms_reconciled = True
+        print(f"Reconciled rooms: {len(stored & member_of)} known, {len(left)} left, "
+              f"{len(self._unhydrated_rooms)} new")
+
+    def _room_for_event(self, room_id: str) -> dict | None:
+        """Get a stored room, hydrating it if the bot is in it but hasn't stored it yet."""
+        room = self.storage.get_room(room_id)
+        if room:
+            return room
+        with self._rooms_lock:
+            hydrate = not self._rooms_reconciled or room_id in self._unhydrated_rooms
+            self._unhydrated_rooms.discard(room_id)
+        if not hydrate:
+            return None
+        try:
+            return self.get_or_create_room(room_id)
+        except Exception as e:
+            print(f"Could not hydrate room {room_id}: {e}")
+            return None
+
+    def _load_seen_activities(self) -> None:
+        """Restore the activity IDs handled shortly before the last shutdown."""
+        if not self._seen_activities_location or not self._seen_activities_location.exists():
+            return
+        try:
+            seen = json.loads(self._seen_activities_location.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not load seen activities from {self._seen_activities_location}: {e}")
+            return
+        now = time.time()
+        for activity_id, seen_at in seen.items():
+            remaining = self._seen_activities.ttl - (now - seen_at)
+            if remaining > 0:
+                self._seen_activities.set(activity_id, seen_at, ttl=remaining)
+
+    def _save_seen_activities(self) -> None:
+        if not self._seen_activities_location:
+            return
+        tmp_location = self._seen_activities_location.with_name(self._seen_activities_location.name + ".tmp")
+        try:
+            tmp_location.write_text(json.dumps(dict(self._seen_activities.items())))
+            os.replace(tmp_location, self._seen_activities_location)
+        except OSError as e:
+            print(f"Could not save seen activities to {self._seen_activities_location}: {e}")
+
     def save(self) -> None:
-        self.storage.save()
-        print("Bot state saved to bot_data.json")
+        self.saver.stop()
+        self.storage.compact()
+        self._save_seen_activities()
+        print("Bot state saved")
+
+    def _room_changed(self, room_id: str) -> None:
+        self.storage.mark_room_dirty(room_id)
+        self.saver.request()
+
+    def _org_tokens_changed(self, org_id: str) -> None:
+        self.storage.mark_org_dirty(org_id)
+        self.saver.request()
+
+    def _timed(self, phase: str, func, *args):
+        """Call a startup step and record how long it took."""
+        started = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            self.startup_timings[phase] = time.monotonic() - started
+
+    async def _timed_async(self, phase: str, coro):
+        started = time.monotonic()
+        try:
+            return await coro
+        finally:
+            self.startup_timings[phase] = time.monotonic() - started
+
+    async def _startup(self) -> bool:
+        """Start the OAuth server and open the websocket concurrently, then print the timing breakdown.
+
+        Returns:
+            True if the websocket is connected
+        """
+        oauth_result, websocket_result = await asyncio.gather(
+            self._timed_async("oauth_server", self.oauth._start_http_server()),
+            self._timed_async("websocket", self._connect_websocket()),
+            return_exceptions=True
+        )
+        if isinstance(oauth_result, BaseException):
+            raise oauth_result
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.startup_timings.items())
+        print(f"Startup: {phases}; {time.monotonic() - _STARTED:.2f}s since process start")
+        if isinstance(websocket_result, BaseException):
+            print(f"WebSocket error: {websocket_result}")
+            return False
+        return True
 
     async def _connect_websocket(self) -> None:
         if not self.device_info:
-            self.device_info = webex_utils.get_device_info(self.bot_token)
+            if self._device_info_future is not None:
+                # Started in __init__, usually done by now
+                future, self._device_info_future = self._device_info_future, None
+                self.device_info = await asyncio.wrap_future(future)
+            else:
+                self.device_info = await asyncio.to_thread(webex_utils.get_device_info, self.bot_token)
         
         ws_url = self.device_info.get("webSocketUrl")
         if not ws_url:
@@ -154,20 +364,29 @@ class BotWS:
 
     async def _process_websocket_message(self, message: str) -> None:
         try:
-            msg = json.loads(message)
+            event_type = _EVENT_TYPE_RE.search(message)
+            self._count(f"frame {event_type.group(1) if event_type else 'unknown'}")
+            # Presence, typing, read receipts and other activities never reach a handler
+            if '"conversation.activity"' not in message or not _HANDLED_ACTIVITY_RE.search(message):
+                return
+            msg = helper.json_loads(message)
             
             if msg.get("data", {}).get("eventType") == "conversation.activity":
                 activity = msg["data"].get("activity", {})
                 verb = activity.get("verb", "")
                 
-                if verb == "post":
-                    await self._handle_message_event(activity)
-                elif verb == "cardAction":
-                    await self._handle_card_event(activity)
-                elif verb == "add":
-                    await self._handle_membership_add_event(activity)
-                elif verb == "leave":
-                    await self._handle_membership_leave_event(activity)
+                handler = self._activity_handlers.get(verb)
+                if handler:
+                    activity_id = activity.get("id", "")
+                    if activity_id and activity_id in self._seen_activities:
+                        self._count("activity_duplicate")
+                        return
+                    if activity_id:
+                        self._seen_activities.set(activity_id, time.time())
+                    self._count(f"activity {verb}")
+                    # Events of one room run in order, rooms run concurrently
+                    room_key = activity.get("target", {}).get("id", "")
+                    self.dispatcher.submit(room_key, handler, activity)
                     
         except json.JSONDecodeError as e:
             print(f"Failed to parse WebSocket message: {e}")
@@ -176,15 +395,71 @@ class BotWS:
             import traceback
             traceback.print_exc()
 
-    async def _handle_message_event(self, activity: dict) -> None:
+    def _count(self, event: str) -> None:
+        with self._event_counts_lock:
+            self.event_counts[event] += 1
+
+    def _report_stats(self) -> None:
+        self.dispatcher.report()
+        with self._event_counts_lock:
+            counts = dict(self.event_counts)
+        if counts:
+            print("Events: " + ", ".join(f"{name} {count}" for name, count in sorted(counts.items())))
+        print(f"Membership cache: {self.members.hits} hits, {self.members.misses} misses")
+        m = self.messenger.stats()
+        print(f"Messenger: {m['queued']} replies in {m['posted']} posts, {m['rejections_suppressed']} rejection notices suppressed")
+        for key, s in webex_admin.rate_limiter.stats().items():
+            print(
+                f"Rate limit {key}: budget {s['budget']:.1f}, throttled for {s['throttled_for']:.1f}s, "
+                f"{s['throttles']} throttles, {s['waited']:.1f}s waited"
+            )
+
+    async def _report_stats_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self._report_stats()
+
+    def _prefilter_post(self, activity: dict) -> bool:
+        """Check a post from its activity alone, before paying for the message fetch.
+
+        Returns:
+            False if the message doesn't need to be fetched
+        """
+        actor = activity.get("actor", {})
+        if webex_utils.is_bot_id(self.bot_id, actor.get("id", "")):
+            self._count("post_skipped_own")
+            return False
+        room_id = webex_utils.extract_room_id_from_target(activity.get("target", {}))
+        room = self._room_for_event(room_id)
+        if not room:
+            self._count("post_skipped_unknown_room")
+            return False
+        # Only skips, the rejection notice and first-user admin setup wait for a post addressed to the bot
+        person_id = webex_utils.extract_person_id_from_actor(actor)
+        room_admin = room['room_admin']
+        if (
+            (room_admin.get('email') or room_admin.get('id'))
+            and person_id != room_admin.get('id')
+            and person_id not in room['room_authorized_users']
+        ):
+            self._count("post_skipped_unauthorized")
+            return False
+        return True
+
+    def _handle_message_event(self, activity: dict) -> None:
         activity_id = activity.get("id", "") 
         if not activity_id:
             return
+        # Without actor and target the checks have to wait for the message itself
+        if activity.get("actor", {}).get("id") and activity.get("target", {}).get("id") \
+                and not self._prefilter_post(activity):
+            return
         try:
             message = self.api.messages.get(webex_utils.activity_id_to_message_id(activity_id))
         except ApiError as e:
             print(f"Failed to get message for activity id {activity_id}: {e}")
             return
+        self._count("post_fetched")
         # Ignore messages from the bot itself
         if message.personId == self.bot_id:
             return
@@ -197,38 +472,39 @@ class BotWS:
         if message.text:
             self.handle_command(message, room_id, person_id)
 
-    async def _handle_card_event(self, activity: dict) -> None:
+    def _handle_card_event(self, activity: dict) -> None:
         activity_id = activity.get("id", "")
         if not activity_id:
             return
         
         attachment_id = webex_utils.activity_id_to_attachment_action_id(activity_id)
         
-        target = activity.get("target", {})
-        room_id = self._extract_room_id_from_target(target)
-        
-        person_id = self.get_id_from_email(activity.get("actor", {}).get("id", ""), room_id)
+        # Everything needed is in the activity, no lookup before the authorization check
+        room_id = webex_utils.extract_room_id_from_target(activity.get("target", {}))
+        person_id = webex_utils.extract_person_id_from_actor(activity.get("actor", {}))
+        if not room_id or not person_id:
+            return
         if not self.is_user_authorized(room_id, person_id):
             return
-        if room_id and person_id:
-            self.handle_card(attachment_id, room_id, person_id)
+        self.handle_card(attachment_id, room_id, person_id)
 
-    async def _handle_membership_add_event(self, activity: dict) -> None:
+    def _handle_membership_add_event(self, activity: dict) -> None:
         obj = activity.get("object", {})
         person_id = obj.get("id", "")
         
         target = activity.get("target", {})
         room_id = webex_utils.extract_room_id_from_target(target)
-        admin_id = self.get_id_from_email(activity.get("actor", {}).get("id", ""), room_id)
         
         if not room_id:
             return
+        self.members.invalidate(room_id)
+        admin_id = webex_utils.extract_person_id_from_actor(activity.get("actor", {}))
         
         if person_id and webex_utils.is_bot_id(self.bot_id, person_id):
             print(f"Bot was added to room {room_id}")
             self.handle_added(room_id, admin_id)
 
-    async def _handle_membership_leave_event(self, activity: dict) -> None:
+    def _handle_membership_leave_event(self, activity: dict) -> None:
         obj = activity.get("object", {})
         person_id = obj.get("id", "")
         
@@ -237,55 +513,25 @@ class BotWS:
         
         if not room_id:
             return
+        self.members.invalidate(room_id)
         
         if person_id and webex_utils.is_bot_id(self.bot_id, person_id):
             print(f"Bot was removed from room {room_id}")
             self.handle_removed(room_id)
 
-    def _activity_id_to_attachment_action_id(self, activity_id: str) -> str:
-        base_string = f"ciscospark://us/ATTACHMENT_ACTION/{activity_id}"
-        return b64encode(base_string.encode("utf-8")).decode("utf-8").rstrip("=")
-
-    def _extract_room_id_from_target(self, target: dict) -> str:
-        target_id = target.get("id", "")
-        if not target_id:
-            return ""
-        
-        base_string = f"ciscospark://us/ROOM/{target_id}"
-        return b64encode(base_string.encode("utf-8")).decode("utf-8").rstrip("=")
-
-    def _extract_person_id_from_actor(self, actor: dict) -> str:
-        actor_id = actor.get("id", "")
-        if not actor_id:
-            return ""
-        base_string = f"ciscospark://us/PEOPLE/{actor_id}"
-        return b64encode(base_string.encode("utf-8")).decode("utf-8").rstrip("=")
-
-    def _is_bot_id(self, person_id: str) -> bool:
-        try:
-            import base64
-            decoded = base64.b64decode(self.bot_id + "==").decode("utf-8")
-            if "/PEOPLE/" in decoded:
-                bot_uuid = decoded.split("/PEOPLE/")[-1]
-                return person_id == bot_uuid
-        except:
-            pass
-        
-        return person_id == self.bot_id
-
     def does_room_manage_org(self, room_id: str) -> bool:
         room = self.storage.get_room(room_id)
         if not room:
             print("Error: Room not found in storage.")
             raise Exception("Room not found in storage.")
-        if room['managed_org'].get('org_id', ''):
+        if self.storage.get_org(room['managed_org'].get('org_id', '')):
             print("Room has an authorized org.")
             return True
         else:
             request_id = secrets.token_urlsafe(32)
             auth_url = self.oauth.create_auth_url(room_id, request_id)
-            message = self.api.messages.create(
-                roomId=room_id, 
+            message = self.messenger.post(
+                room_id,
                 markdown=f"To get started, please authorize with your admin account:\n\n[Click here to authorize]({auth_url})"
             )
             self.active_auth_requests[request_id] = message.id
@@ -296,26 +542,37 @@ class BotWS:
         if not room:
             print("Error: Room not found in storage.")
             return
-        room['managed_org'] = {
-            'org_id': '',
-            'org_name': '',
-            'oauth_tokens': {}
-        }
+        self._admin_contexts.pop(room['managed_org'].get('org_id', ''))
+        webex_admin.invalidate_workspaces(room['managed_org'].get('org_id', ''))
+        with self.storage.lock:
+            room['managed_org'] = {'org_id': ''}
+        self.storage.mark_room_dirty(room_id)
+        # Drop the org's credentials once no room uses them anymore
+        self.storage.prune_orgs()
+        self.saver.request()
         print(f"Removed managed organization from room {room_id}")
 
     def get_email_from_id(self, person_id: str, room_id: str) -> str:
+        email = self.members.get_email(room_id, person_id)
+        if email is not None:
+            return email
         try:
             memberships = self.api.memberships.list(roomId=room_id, personId=person_id)
             for membership in memberships:
+                self.members.remember(room_id, membership.personId, membership.personEmail)
                 return membership.personEmail
             return ""
         except ApiError:
             return ""
 
     def get_id_from_email(self, email: str, room_id: str) -> str:
+        person_id = self.members.get_id(room_id, email)
+        if person_id is not None:
+            return person_id
         try:
             memberships = self.api.memberships.list(roomId=room_id, personEmail=email)
             for membership in memberships:
+                self.members.remember(room_id, membership.personId, email)
                 return membership.personId
             return ""
         except ApiError:
@@ -330,11 +587,14 @@ class BotWS:
         if not admin_id:
             print(f"Error: User {user_email} not found in room {room_id}.")
             return False
-        room['room_admin']['email'] = user_email
-        room['room_admin']['id'] = admin_id
+        # The saver thread may be encoding this room, change it under the storage lock
+        with self.storage.lock:
+            room['room_admin']['email'] = user_email
+            room['room_admin']['id'] = admin_id
+        self._room_changed(room_id)
         if not quiet:
-            self.api.messages.create(
-                roomId=room_id,
+            self.messenger.send(
+                room_id,
                 text=f"User {user_email} is now the room admin."
             )
         return True
@@ -344,15 +604,15 @@ class BotWS:
         if not room:
             print("Error: Room not found in storage.")
             return False
-        try:
-            memberships = list(self.api.memberships.list(roomId=room_id, personEmail=user_email))
-            if not memberships:
-                print(f"Error: User {user_email} not found in room {room_id}.")
-                return False
-            room['room_authorized_users'].append(memberships[0].personId)
-        except ApiError:
-            print(f"Error: Could not retrieve memberships for user {user_email} in room {room_id}.")
+        person_id = self.get_id_from_email(user_email, room_id)
+        if not person_id:
+            print(f"Error: User {user_email} not found in room {room_id}.")
             return False
+        with self.storage.lock:
+            added = person_id not in room['room_authorized_users']
+            room['room_authorized_users'].add(person_id)
+        if added:
+            self._room_changed(room_id)
         return True
     
     def remove_allowed_user(self, room_id: str, user_email: str) -> bool:
@@ -365,8 +625,11 @@ class BotWS:
             print(f"Error: User {user_email} not found in room {room_id}.")
             return False
         person_id = admin_id
-        if person_id in room['room_authorized_users']:
-            room['room_authorized_users'].remove(person_id)
+        with self.storage.lock:
+            removed = person_id in room['room_authorized_users']
+            room['room_authorized_users'].discard(person_id)
+        if removed:
+            self._room_changed(room_id)
             return True
         else:
             print(f"Error: User {user_email} is not in the authorized users list for room {room_id}.")
@@ -382,19 +645,24 @@ class BotWS:
             room_id,
             room_details.title
         )
-        self.api.messages.create(
-            roomId=room_id,
+        self.saver.request()
+        self.messenger.send(
+            room_id,
             text="Hello! I'm here to help you provision Webex Boards for your organization."
         )
         self.set_room_admin(room_id, admin_email)
         self.does_room_manage_org(room_id)
 
     def handle_removed(self, room_id: str) -> None:
+        with self._rooms_lock:
+            self._unhydrated_rooms.discard(room_id)
         self.storage.remove_room(room_id)
+        self.storage.prune_orgs()
+        self.saver.request()
         print(f"Cleaned up state for room {room_id}")
 
     def is_user_authorized(self, room_id: str, actor_id: str) -> bool:
-        room = self.storage.get_room(room_id)
+        room = self._room_for_event(room_id)
         if not room:
             print("Error: Room not found in storage.")
             return False
@@ -406,24 +674,56 @@ class BotWS:
         authorized = actor_id in room['room_authorized_users'] or actor_id == room_admin['id']
         if not authorized:
             room_admin_email = room['room_admin'].get('email', 'the room admin')
-            self.api.messages.create(
-                roomId=room_id,
-                text=f"You don't have rights in this room, please ask {room_admin_email} to grant you permissions."
+            # Repeated attempts by the same person only get a notice every so often
+            self.messenger.notify_unauthorized(
+                room_id,
+                actor_id,
+                f"You don't have rights in this room, please ask {room_admin_email} to grant you permissions."
             )
         return authorized
     
+    def _org_for_room(self, room) -> dict:
+        org_id = room.get('managed_org', {}).get('org_id', '')
+        org = self.storage.get_org(org_id)
+        if not org:
+            raise Exception(f"No authorized org for room {room.get('room_id')}")
+        return org
+
     def get_valid_token_for_room(self, room) -> str:
-        tokens = room.get('managed_org', {}).get('oauth_tokens', {})
-        access_token = tokens.get('access_token')
-        refresh_token = tokens.get('refresh_token')
-        expires_at = datetime.datetime.fromisoformat(tokens.get('expires_at', '1970-01-01T00:00:00'))
-        if not access_token or time() >= expires_at.timestamp():
-            print("Access token missing or expired.")
-            tokens = self.oauth.refresh_tokens(refresh_token=refresh_token)
-            room['managed_org']['oauth_tokens'] = tokens
-            access_token = room['managed_org']['oauth_tokens']['access_token']
-        return access_token
+        # Tokens are refreshed in the background ahead of expiry, this only refreshes if that fell behind
+        org = self._org_for_room(room)
+        return self.tokens.get_access_token(org['org_id'], org)
+
+    def refresh_token_for_org(self, org_id: str) -> str:
+        """Refresh the access token of an org regardless of its stored expiry."""
+        org = self.storage.get_org(org_id)
+        if not org:
+            raise Exception(f"No authorized org {org_id}")
+        stale_token = org.get('oauth_tokens', {}).get('access_token')
+        return self.tokens.refresh(org_id, org, stale_token=stale_token)
+
+    def _token_holders(self):
+        """Orgs with stored tokens, as (key, holder) pairs for the token manager."""
+        return [(org['org_id'], org) for org in self.storage.get_orgs() if org.get('oauth_tokens')]
     
+    def _admin_for_room(self, room) -> AsyncWebexAdmin:
+        """Get the cached admin client of the room's org, switching it to the org's current token."""
+        token = self.get_valid_token_for_room(room)
+        org_id = room['managed_org'].get('org_id', '')
+        webex_admin = self._admin_contexts.get(org_id)
+        if webex_admin is None:
+            # Shared by every room of the org, a rejected request refreshes the org's token and retries once
+            webex_admin = self._run_coro(AsyncWebexAdmin.create(
+                my_token=token,
+                token_refresher=lambda: self.refresh_token_for_org(org_id)
+            ))
+            if org_id:
+                self._admin_contexts.set(org_id, webex_admin)
+        elif webex_admin.my_token != token:
+            # Refreshed in the background since the client was cached
+            webex_admin.set_token(token)
+        return webex_admin
+
     def handle_card(self, attachment_id: str, room_id: str, actor_id: str) -> None:
         try:
             if not self.does_room_manage_org(room_id):
@@ -438,24 +738,22 @@ class BotWS:
             print("Error: Room not found in storage.")
             return
         
-        webex_admin = WebexAdmin(
-            my_token=self.get_valid_token_for_room(room)
-        )
+        webex_admin = self._admin_for_room(room)
         new_workspace_name = card_input.inputs["workspace"].strip()
         existing_workspace_id = card_input.inputs.get("existing-workspace", "").strip()
         if not new_workspace_name and not existing_workspace_id:
-            self.api.messages.create(
-                roomId=room_id,
+            self.messenger.send(
+                room_id,
                 text="Please provide a workspace name or select an existing workspace."
             )
             return
         
-        existing_workspace_name = webex_admin.list_workspaces().get(existing_workspace_id, "")
+        existing_workspace_name = self._run_coro(webex_admin.list_workspaces()).get(existing_workspace_id, "")
         workspace_name = new_workspace_name if new_workspace_name else existing_workspace_name
-        activation_code = webex_admin.get_activation_code(new_workspace_name, existing_workspace_id)
+        activation_code = self._run_coro(webex_admin.get_activation_code(new_workspace_name, existing_workspace_id))
         if activation_code == "":
-            self.api.messages.create(
-                roomId=room_id,
+            self.messenger.send(
+                room_id,
                 text="Something went wrong. Please check if you need to update the access "
                         "token or if you've been sending too many requests."
             )
@@ -463,12 +761,47 @@ class BotWS:
         
         activation_code = helper.split_code(activation_code)
         print("Sending activation code.")
-        self.api.messages.create(
-            roomId=room_id,
-            markdown=f"Here's your activation code: {activation_code} for workspace *{workspace_name}*"
-        )
+        # Posted right away rather than queued, so a failure to deliver the code shows up here
+        try:
+            self.messenger.post(
+                room_id,
+                markdown=f"Here's your activation code: {activation_code} for workspace *{workspace_name}*"
+            )
+        except ApiError as e:
+            print(f"Failed to send activation code for workspace {workspace_name} to room {room_id}: {e}")
     
 
+    def _snapshot_room_members(self, room_id: str) -> None:
+        """Load every membership of a room into the membership cache with one listing."""
+        try:
+            members = [
+                (membership.personId, membership.personEmail)
+                for membership in self.api.memberships.list(roomId=room_id, max=1000)
+            ]
+        except ApiError as e:
+            # Lookups fall back to one request per person
+            print(f"Could not list memberships of room {room_id}: {e}")
+            return
+        self.members.remember_all(room_id, members)
+
+    def _command_targets(self, message_obj, command: list, room_id: str) -> list:
+        """Emails of the people an add/remove command is about, from mentions and from the text."""
+        mentioned = [
+            person_id for person_id in (getattr(message_obj, 'mentionedPeople', None) or [])
+            if person_id != self.bot_id
+        ]
+        typed = [word for word in command[1:] if '@' in word and '.' in word]
+        if not mentioned and not typed:
+            return []
+        unresolved = [person_id for person_id in mentioned if self.members.get_email(room_id, person_id) is None]
+        unresolved += [email for email in typed if self.members.get_id(room_id, email) is None]
+        # One listing resolves every target instead of a lookup per mention and per email,
+        # not worth it for a single lookup as a large room takes a request per 1000 members
+        if len(unresolved) > 1:
+            self._snapshot_room_members(room_id)
+        emails = [self.get_email_from_id(person_id, room_id) for person_id in mentioned] + typed
+        return list(dict.fromkeys(email for email in emails if email))
+
     def handle_command(self, message_obj, room_id: str, actor_id: str) -> None:
         message_text = message_obj.text
         words = message_text.split()
@@ -491,38 +824,21 @@ class BotWS:
                 self.does_room_manage_org(room_id)
                 return
             case "add":
-                emails_to_add = set()
-
-                # Check for mentions
-                if hasattr(message_obj, 'mentionedPeople') and message_obj.mentionedPeople:
-                    for person_id in message_obj.mentionedPeople:
-                        if person_id == self.bot_id:
-                            continue
-                        email = self.get_email_from_id(person_id, room_id)
-                        if email:
-                            emails_to_add.add(email)
-
-                # Check for emails in text
-                for word in command[1:]:
-                    if '@' in word and '.' in word:
-                        emails_to_add.add(word)
-
-                for email in emails_to_add:
-                    success = self.add_allowed_user(room_id, email)
-                    if success:
-                        self.api.messages.create(
-                            roomId=room_id,
-                            text=f"User {email} added successfully."
-                        )
-                    else:
-                        self.api.messages.create(
-                            roomId=room_id,
-                            text=f"Failed to add user {email}. Make sure they are in this room."
-                        )
+                added, failed = [], []
+                for email in self._command_targets(message_obj, command, room_id):
+                    (added if self.add_allowed_user(room_id, email) else failed).append(email)
+                lines = []
+                if added:
+                    lines.append(f"User{'s' if len(added) > 1 else ''} {', '.join(added)} added successfully.")
+                if failed:
+                    lines.append(f"Failed to add user{'s' if len(failed) > 1 else ''} {', '.join(failed)}. "
+                                 "Make sure they are in this room.")
+                if lines:
+                    self.messenger.send(room_id, text="\n".join(lines))
                 return
             case "help":
-                self.api.messages.create(
-                    roomId=room_id,
+                self.messenger.send(
+                    room_id,
                     markdown=(
                         f"### Say @{self.bot_name} hello"
                         " to provision a board. \n\nOther commands include:\n- "
@@ -539,42 +855,31 @@ class BotWS:
                     )
                 )
             case "remove":
-                emails_to_remove = set()
-                # Check for mentions
-                if hasattr(message_obj, 'mentionedPeople') and message_obj.mentionedPeople:
-                    for person_id in message_obj.mentionedPeople:
-                        if person_id == self.bot_id:
-                            continue
-                        email = self.get_email_from_id(person_id, room_id)
-                        if email:
-                            emails_to_remove.add(email)
-                # Check for emails in text
-                for word in command[1:]:
-                    if '@' in word and '.' in word:
-                        emails_to_remove.add(word)
-                for email in emails_to_remove:
-                    success = self.remove_allowed_user(room_id, email)
-                    if success:
-                        self.api.messages.create(
-                            roomId=room_id,
-                            text=f"User {email} removed successfully.")
-                    else:
-                        self.api.messages.create(
-                            roomId=room_id,
-                            text=f"Failed to remove user {email}. Make sure they are in the allowed users list.")
+                removed, failed = [], []
+                for email in self._command_targets(message_obj, command, room_id):
+                    (removed if self.remove_allowed_user(room_id, email) else failed).append(email)
+                lines = []
+                if removed:
+                    lines.append(f"User{'s' if len(removed) > 1 else ''} {', '.join(removed)} removed successfully.")
+                if failed:
+                    lines.append(f"Failed to remove user{'s' if len(failed) > 1 else ''} {', '.join(failed)}. "
+                                 "Make sure they are in the allowed users list.")
+                if lines:
+                    self.messenger.send(room_id, text="\n".join(lines))
             case "info":
                 room = self.storage.get_room(room_id)
                 if not room:
                     print("Error: Room not found in storage.")
                     return
-                org_name = room['managed_org'].get('org_name', 'N/A')
-                org_id = room['managed_org'].get('org_id', 'N/A')
+                org = self.storage.get_org(room['managed_org'].get('org_id', '')) or {}
+                org_name = org.get('org_name', 'N/A')
+                org_id = org.get('org_id', 'N/A')
                 room_admin_email = room['room_admin'].get('email', 'N/A')
                 authorized_users = []
                 if room['room_authorized_users']:
                     try:
                         chunk_size = 50
-                        user_ids = room['room_authorized_users']
+                        user_ids = sorted(room['room_authorized_users'])
                         for i in range(0, len(user_ids), chunk_size):
                             chunk = user_ids[i:i + chunk_size]
                             try:
@@ -589,8 +894,8 @@ class BotWS:
                     except Exception as e:
                         print(f"Unexpected error processing authorized users: {e}")
                 authorized_users_str = ", ".join(authorized_users) if authorized_users else "N/A"
-                self.api.messages.create(
-                    roomId=room_id,
+                self.messenger.post(
+                    room_id,
                     markdown=(
                         f"**This room is linked to the following organization:**\n"
                         f"- Organization Name: {org_name}\n"
@@ -607,27 +912,39 @@ class BotWS:
                     return
 
                 if len(command) < 2:
-                    self.api.messages.create(
-                        roomId=room_id,
+                    self.messenger.send(
+                        room_id,
                         text="Please provide a workspace name."
                     )
                     return
 
-                webex_admin = WebexAdmin(
-                    my_token=self.get_valid_token_for_room(room)
-                )
+                webex_admin = self._admin_for_room(room)
                 workspace_name = " ".join(command[1:])
                 
                 if workspace_name.lower() == "all":
+                    # One inventory fetch for the whole org instead of one request per workspace
+                    devices = self._run_coro(webex_admin.get_all_devices())
+                    workspaces = self._run_coro(webex_admin.list_workspaces()) if devices is not None else {}
+                    if not workspaces:
+                        # A failed listing would otherwise show every workspace with 0 devices
+                        self.messenger.send(
+                            room_id,
+                            text="Could not list the organization's workspaces and devices. Please try again later."
+                        )
+                        return
+                    devices_by_workspace = group_devices_by_workspace(devices)
                     response = ""
-                    for workspace_id, workspace_name in webex_admin.list_workspaces().items():
-                        response += self.workspace_details_string(workspace_id, workspace_name, webex_admin)+"\n"
+                    for workspace_id, workspace_name in workspaces.items():
+                        response += self.workspace_details_string(
+                            workspace_id, workspace_name, devices_by_workspace.get(workspace_id, [])
+                        )+"\n"
                 else:
+                    workspace_id = self._run_coro(webex_admin.get_workspace_id(workspace_name))
                     response = self.workspace_details_string(
-                        webex_admin.get_workspace_id(workspace_name), workspace_name, webex_admin
+                        workspace_id, workspace_name, self._run_coro(webex_admin.get_devices(workspace_id))
                     )
-                self.api.messages.create(
-                    roomId=room_id,
+                self.messenger.post(
+                    room_id,
                     markdown=response
                 )
                 
@@ -635,20 +952,14 @@ class BotWS:
                 room = self.storage.get_room(room_id)
                 if not self.does_room_manage_org(room_id):
                     return
-                message = self.api.messages.create(
-                    roomId=room_id,
-                    text="fetching details of your org..."
-                )
-                self.api.messages.create(
-                    roomId=room_id,
+                self.messenger.post(
+                    room_id,
                     text="Here's your card",
                     attachments=[self.code_card(room)]
                 )
-                self.api.messages.delete(messageId=message.id)
                 
 
-    def workspace_details_string(self, workspace_id: str, workspace_name: str, webex_admin) -> str:
-        devices = webex_admin.get_devices(workspace_id)
+    def workspace_details_string(self, workspace_id: str, workspace_name: str, devices: list | None) -> str:
         if devices is None:
             return f"No devices in workspace '{workspace_name}'"
         else:
@@ -685,10 +996,20 @@ class BotWS:
         reconnect_delay = 5
         max_reconnect_delay = 300
         
-        await self.oauth._start_http_server()
+        stats_interval = float(os.getenv("DISPATCH_STATS_INTERVAL", "300"))
+        stats_task = asyncio.create_task(self._report_stats_periodically(stats_interval)) if stats_interval > 0 else None
+        token_task = asyncio.create_task(self.tokens.run(self._token_holders))
+        # Runs while the websocket connects, events arriving meanwhile hydrate their room on demand
+        reconcile_task = asyncio.create_task(asyncio.to_thread(self._reconcile_rooms))
+        connected = await self._startup()
+        if not connected and self.running:
+            print(f"Reconnecting in {reconnect_delay} seconds...")
+            await asyncio.sleep(reconnect_delay)
         while self.running:
             try:
-                await self._connect_websocket()
+                if not connected:
+                    await self._connect_websocket()
+                connected = False
                 reconnect_delay = 5
                 
                 print("Listening for Webex events...")
@@ -715,6 +1036,13 @@ class BotWS:
                 await asyncio.sleep(reconnect_delay)
                 reconnect_delay = min(reconnect_delay * 2, max_reconnect_delay)
 
+        if stats_task:
+            stats_task.cancel()
+        token_task.cancel()
+        await asyncio.gather(reconcile_task, return_exceptions=True)
+        await self.dispatcher.drain()
+        await webex_admin.close_session()
+
 
     def run(self) -> None:
         self.running = True
@@ -733,6 +1061,8 @@ class BotWS:
         try:
             self.loop.run_until_complete(self._run_loop())
         finally:
+            self.dispatcher.shutdown()
+            self.messenger.stop()
             self.loop.close()
             print("Bot stopped")
 
@@ -743,16 +1073,26 @@ class BotWS:
 
 
 if __name__ == "__main__":
-    bot_data_location = Path("bot_data.json")
+    bot_data_location = Path(os.getenv("BOT_DATA_FILE", "bot_data.json"))
     # create file if it doesn't exist
     if not bot_data_location.exists():
+        bot_data_location.parent.mkdir(parents=True, exist_ok=True)
         bot_data_location.touch()
         
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     if not BOT_TOKEN:
         print("ERROR: BOT_TOKEN is required")
         sys.exit(1)
-    bot = BotWS(bot_token=BOT_TOKEN, storage=StorageManager(fileLocation=bot_data_location))
+    if os.getenv("STORAGE_BACKEND", "json").lower() == "sqlite":
+        bot_db_location = Path(os.getenv("BOT_DB_FILE", "bot_data.db"))
+        bot_db_location.parent.mkdir(parents=True, exist_ok=True)
+        storage = SQLiteStorageManager(dbLocation=bot_db_location, import_from=bot_data_location)
+    else:
+        storage = StorageManager(
+            fileLocation=bot_data_location,
+            compact_every=int(os.getenv("STORAGE_COMPACT_EVERY", "1000"))
+        )
+    bot = BotWS(bot_token=BOT_TOKEN, storage=storage)
     
     print(f"Starting WebSocket bot: {bot.bot_name} ({bot.bot_email})")
     print("Press Ctrl+C to stop")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""TTLCache - Small thread-safe in-process cache with expiring entries.
+
+Handlers run on worker threads, so every access is guarded by a lock.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """Dictionary-like cache whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, ttl: float, max_size: int | None = None):
+        """Initialize cache.
+
+        Args:
+            ttl: Lifetime of an entry in seconds
+            max_size: Maximum number of entries, least recently used are evicted first
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get a value, or default if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        """Store a value for `ttl` seconds, the cache's default unless given."""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            if self.max_size is not None:
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def replace(self, key, value) -> bool:
+        """Swap the value of a live entry without extending its expiry.
+
+        Returns:
+            True if the entry existed and was replaced
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[1]:
+                return False
+            self._entries[key] = (value, entry[1])
+            return True
+
+    def pop(self, key, default=None):
+        """Remove an entry and return its value (expired or not)."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[0] if entry else default
+
+    def items(self) -> list:
+        """Live (key, value) pairs, least recently used first."""
+        with self._lock:
+            now = time.monotonic()
+            return [(key, value) for key, (value, expires_at) in self._entries.items() if now < expires_at]
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+_MISSING = object()
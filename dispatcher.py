@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""EventDispatcher - Runs websocket event handlers off the event loop.
+
+This module keeps the websocket receive loop responsive by:
+1. Offloading blocking handler work to a bounded pool of worker threads
+2. Keeping events for the same room in order, one at a time
+3. Letting events for different rooms run concurrently
+4. Tracking queue depth and handler latency
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+import traceback
+
+
+class EventDispatcher:
+    """Dispatches handler calls to a worker pool with per-key ordering."""
+
+    def __init__(self, max_workers: int = 8, slow_threshold: float = 5.0):
+        """Initialize dispatcher.
+
+        Args:
+            max_workers: Maximum number of handlers running at the same time
+            slow_threshold: Handlers slower than this (seconds) are logged
+        """
+        self.max_workers = max_workers
+        self.slow_threshold = slow_threshold
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bot-worker")
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._consumers: dict[str, asyncio.Task] = {}
+        self._in_flight = 0
+        self._handled = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+    def submit(self, key: str, func, *args) -> None:
+        """Queue func(*args) behind earlier work submitted with the same key.
+
+        Must be called from the event loop thread.
+        """
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[key] = queue
+            self._consumers[key] = asyncio.get_running_loop().create_task(self._consume(key, queue))
+        queue.put_nowait((func, args, time.monotonic()))
+
+    async def _consume(self, key: str, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            func, args, enqueued_at = await queue.get()
+            started_at = time.monotonic()
+            self._in_flight += 1
+            try:
+                await loop.run_in_executor(self._executor, func, *args)
+            except Exception as e:
+                self._failed += 1
+                print(f"Error in handler {getattr(func, '__name__', func)} for {key}: {e}")
+                traceback.print_exc()
+            finally:
+                self._in_flight -= 1
+            finished_at = time.monotonic()
+            self._record(started_at - enqueued_at, finished_at - started_at)
+            if finished_at - started_at > self.slow_threshold:
+                print(f"Slow handler {getattr(func, '__name__', func)} for {key}: {finished_at - started_at:.2f}s")
+            queue.task_done()
+            # No await between this check and the cleanup, so submit() cannot interleave
+            if queue.empty():
+                del self._queues[key]
+                del self._consumers[key]
+                return
+
+    def _record(self, wait: float, run: float) -> None:
+        self._handled += 1
+        self._wait_total += wait
+        self._run_total += run
+        self._run_max = max(self._run_max, run)
+
+    def stats(self) -> dict:
+        """Get queue depth and latency counters.
+
+        Returns:
+            Dictionary of dispatcher metrics, latencies in seconds
+        """
+        handled = self._handled or 1
+        return {
+            "queued": sum(queue.qsize() for queue in self._queues.values()),
+            "active_keys": len(self._queues),
+            "in_flight": self._in_flight,
+            "handled": self._handled,
+            "failed": self._failed,
+            "avg_wait": self._wait_total / handled,
+            "avg_latency": self._run_total / handled,
+            "max_latency": self._run_max,
+        }
+
+    def report(self) -> None:
+        """Print dispatcher stats."""
+        s = self.stats()
+        print(
+            f"Dispatcher: {s['queued']} queued, {s['in_flight']} running over {s['active_keys']} rooms, "
+            f"{s['handled']} handled ({s['failed']} failed), avg wait {s['avg_wait']:.3f}s, "
+            f"avg latency {s['avg_latency']:.3f}s, max {s['max_latency']:.3f}s"
+        )
+
+    async def drain(self) -> None:
+        """Wait for all queued handlers to finish."""
+        while self._consumers:
+            await asyncio.gather(*list(self._consumers.values()), return_exceptions=True)
+
+    def shutdown(self) -> None:
+        """Stop the worker pool."""
+        self._executor.shutdown(wait=True)
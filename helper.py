@@ -1,9 +1,15 @@
 from webexteamssdk.models.cards import AdaptiveCard, TextBlock, Text, Choice
 from webexteamssdk.models.cards.actions import Submit
 from webexteamssdk.models.cards.inputs import Choices
-from json import JSONDecodeError
+from typing import NamedTuple
 import json
 
+try:
+    # Optional faster JSON backend
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def make_code_card(workspaces: dict) -> AdaptiveCard:
     greeting = TextBlock("New activation code request", size="Medium", weight="Bolder")
@@ -26,17 +32,39 @@ def split_code(code) -> str:
     return code[:4] + '-' + code[4:8] + '-' + code[8:12] + '-' + code[12:]
 
 
-def load_text(text):
-    try:
-        text = json.loads(text.content)
-        return text
-    except JSONDecodeError:
-        return text
+def json_loads(data):
+    """Decode JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
+class ApiResult(NamedTuple):
+    """Webex API response decoded exactly once."""
+    status: int
+    data: dict | None = None
+    error: str = ""
+    headers: dict | None = None
 
-def is_json(text):
+    @property
+    def ok(self) -> bool:
+        return not self.error
+
+
+def parse_response(status: int, content_type: str, body: bytes, headers=None) -> ApiResult:
+    """Validate status code and content type, then decode the JSON body once."""
+    headers = headers if headers is not None else {}
+    if "json" not in (content_type or ""):
+        text = body.decode("utf-8", errors="replace") if isinstance(body, bytes) else str(body)
+        error = f"HTTP {status}: unexpected content type {content_type!r}: {text[:200]}"
+        return ApiResult(status, None, error, headers)
     try:
-        text.json()
-        return True
-    except JSONDecodeError:
-        return False
+        data = json_loads(body) if body else {}
+    except ValueError as e:
+        return ApiResult(status, None, f"HTTP {status}: invalid JSON body: {e}", headers)
+    if not isinstance(data, dict):
+        return ApiResult(status, None, f"HTTP {status}: unexpected JSON body: {data!r}", headers)
+    if status // 100 != 2:
+        return ApiResult(status, data, f"HTTP {status}: {data.get('message', data)}", headers)
+    return ApiResult(status, data, "", headers)
+
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""MembershipCache - Remembers who is in which room, by person ID and by email.
+
+Entries are filled lazily from membership lookups and dropped per room when
+the room's membership changes, with a TTL as a safety net for missed events.
+"""
+
+import threading
+
+from cache import TTLCache
+
+
+class MembershipCache:
+    """Per-room two-way mapping between person IDs and emails."""
+
+    def __init__(self, ttl: float, max_rooms: int | None = None):
+        """Initialize membership cache.
+
+        Args:
+            ttl: Lifetime of a room's entries in seconds
+            max_rooms: Maximum number of rooms kept, least recently used are evicted first
+        """
+        self._rooms = TTLCache(ttl=ttl, max_size=max_rooms)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, room_id: str, index: str, key: str) -> str | None:
+        members = self._rooms.get(room_id)
+        value = members[index].get(key) if members else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def get_email(self, room_id: str, person_id: str) -> str | None:
+        """Email of a person in a room, or None if not cached."""
+        return self._lookup(room_id, "by_id", person_id)
+
+    def get_id(self, room_id: str, email: str) -> str | None:
+        """Person ID for an email in a room, or None if not cached."""
+        return self._lookup(room_id, "by_email", email.lower())
+
+    def remember(self, room_id: str, person_id: str, email: str) -> None:
+        """Record that a person with this email is a member of the room."""
+        self.remember_all(room_id, [(person_id, email)])
+
+    def remember_all(self, room_id: str, members) -> None:
+        """Record many (person_id, email) members of a room, copying the room's maps once."""
+        with self._lock:
+            current = self._rooms.get(room_id)
+            # Copy on write, readers on other threads may hold the current maps
+            by_id = dict(current["by_id"]) if current else {}
+            by_email = dict(current["by_email"]) if current else {}
+            for person_id, email in members:
+                if person_id and email:
+                    by_id[person_id] = email
+                    by_email[email.lower()] = person_id
+            if not by_id:
+                return
+            room = {"by_id": by_id, "by_email": by_email}
+            if not self._rooms.replace(room_id, room):
+                self._rooms.set(room_id, room)
+
+    def invalidate(self, room_id: str) -> None:
+        """Forget everything cached for a room."""
+        self._rooms.pop(room_id)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""OutboundMessenger - Batches the bot's replies per room.
+
+This module:
+1. Coalesces replies queued for the same room within a short window into one message
+2. Sends batches of different rooms concurrently, batches of one room in order
+3. Rate-limits repeated "you don't have rights" notices per person and room
+4. Keeps immediate posts (cards, messages whose ID is needed) behind the room's queued replies
+5. Retries a batch whose post failed once
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+
+class OutboundMessenger:
+    """Queues replies and posts them per room through a WebexTeamsAPI."""
+
+    def __init__(self, api, window: float = 0.5, max_workers: int = 4, rejection_interval: float = 300,
+                 retry_delay: float = 1.0):
+        """Initialize messenger and start its thread.
+
+        Args:
+            api: WebexTeamsAPI used to post messages
+            window: Seconds to collect further replies for a room before posting
+            max_workers: Rooms whose batches are posted at the same time
+            rejection_interval: Seconds between two rejection notices to the same person in a room
+            retry_delay: Seconds to wait before retrying a batch whose post failed
+        """
+        self.api = api
+        self.window = window
+        self.rejection_interval = rejection_interval
+        self.retry_delay = retry_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="messenger")
+        self._condition = threading.Condition()
+        # room_id -> (deadline, [(text, markdown)])
+        self._pending: dict[str, tuple[float, list]] = {}
+        self._sending: set[str] = set()
+        self._last_rejection: dict[tuple[str, str], float] = {}
+        self._stopping = False
+        self.queued = 0
+        self.posted = 0
+        self.rejections_suppressed = 0
+        self._thread = threading.Thread(target=self._run, name="messenger", daemon=True)
+        self._thread.start()
+
+    def send(self, room_id: str, text: str = "", markdown: str = "") -> None:
+        """Queue a reply, posted together with the room's other replies of the window."""
+        with self._condition:
+            self.queued += 1
+            if room_id not in self._pending:
+                self._pending[room_id] = (time.monotonic() + self.window, [])
+            self._pending[room_id][1].append((text, markdown))
+            self._condition.notify()
+
+    def notify_unauthorized(self, room_id: str, person_id: str, text: str) -> bool:
+        """Queue a rejection notice unless the person got one recently.
+
+        Returns:
+            True if the notice was queued
+        """
+        key = (room_id, person_id)
+        now = time.monotonic()
+        with self._condition:
+            last = self._last_rejection.get(key)
+            if last is not None and now - last < self.rejection_interval:
+                self.rejections_suppressed += 1
+                return False
+            self._last_rejection[key] = now
+            # Forget people who stopped trying
+            if len(self._last_rejection) > 10000:
+                self._last_rejection = {
+                    k: t for k, t in self._last_rejection.items() if now - t < self.rejection_interval
+                }
+        self.send(room_id, text=text)
+        return True
+
+    def post(self, room_id: str, **kwargs):
+        """Post a message right away, after the room's queued replies, and return it.
+
+        Failures are raised to the caller, not retried.
+        """
+        batch = self._claim_room(room_id)
+        try:
+            if batch:
+                self._send_batch(room_id, batch)
+            # Still holding the room, replies queued meanwhile wait until this is posted
+            return self.api.messages.create(roomId=room_id, **kwargs)
+        finally:
+            self._release_room(room_id)
+
+    def _claim_room(self, room_id: str) -> list:
+        """Hold the room for posting and take its pending replies, waiting for a batch still being posted."""
+        with self._condition:
+            while room_id in self._sending:
+                self._condition.wait()
+            self._sending.add(room_id)
+            entry = self._pending.pop(room_id, None)
+            return entry[1] if entry else []
+
+    def _release_room(self, room_id: str) -> None:
+        with self._condition:
+            self._sending.discard(room_id)
+            self._condition.notify_all()
+
+    def _send_batch(self, room_id: str, batch: list) -> None:
+        # Identical replies, e.g. notices to several people, are posted once
+        batch = list(dict.fromkeys(batch))
+        if any(markdown for _, markdown in batch):
+            message = {"markdown": "\n\n".join(markdown or text for text, markdown in batch)}
+        else:
+            message = {"text": "\n".join(text for text, _ in batch)}
+        for attempt in range(2):
+            try:
+                self.api.messages.create(roomId=room_id, **message)
+                break
+            except Exception as e:
+                if attempt:
+                    print(f"Failed to post {len(batch)} queued replies to room {room_id}: {e}")
+                    return
+                print(f"Posting {len(batch)} queued replies to room {room_id} failed, retrying: {e}")
+                time.sleep(self.retry_delay)
+        with self._condition:
+            self.posted += 1
+
+    def _send_claimed(self, room_id: str, batch: list) -> None:
+        try:
+            self._send_batch(room_id, batch)
+        finally:
+            self._release_room(room_id)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                batches = []
+                for room_id, (deadline, batch) in list(self._pending.items()):
+                    if (deadline <= now or self._stopping) and room_id not in self._sending:
+                        del self._pending[room_id]
+                        self._sending.add(room_id)
+                        batches.append((room_id, batch))
+                if not batches:
+                    if self._stopping and not self._pending and not self._sending:
+                        return
+                    # Rooms still being posted wake us up when they are done
+                    deadlines = [deadline for room_id, (deadline, _) in self._pending.items()
+                                 if room_id not in self._sending]
+                    self._condition.wait(max(min(deadlines) - now, 0.0) if deadlines else None)
+                    continue
+            for room_id, batch in batches:
+                self._executor.submit(self._send_claimed, room_id, batch)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {"queued": self.queued, "posted": self.posted, "rejections_suppressed": self.rejections_suppressed}
+
+    def stop(self) -> None:
+        """Post everything still queued and stop."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
@@ -2,15 +2,18 @@
 import asyncio
 import base64
 import datetime
+import importlib
 import secrets
 import time
+from typing import TYPE_CHECKING
 from urllib.parse import urlencode, urlparse
-from aiohttp import web
 import os
-from jinja2 import Environment, FileSystemLoader, select_autoescape
 
 from oauth import OAuthFlow, DEFAULT_SCOPES, WEBEX_AUTH_URL
 
+if TYPE_CHECKING:
+    from aiohttp import web
+
 
 class OAuthManager:
     def __init__(self, client_id: str, client_secret: str, redirect_uri: str, tokens_store_function):
@@ -29,11 +32,18 @@ class OAuthManager:
             redirect_uri=self.redirect_uri,
             scopes=self.scopes
         )
-        
-        self.jinja_env = Environment(
-            loader=FileSystemLoader("templates"),
-            autoescape=select_autoescape()
-        )
+        self._jinja_env = None
+
+    @property
+    def jinja_env(self):
+        """Template environment, created when the first page is rendered."""
+        if self._jinja_env is None:
+            from jinja2 import Environment, FileSystemLoader, select_autoescape
+            self._jinja_env = Environment(
+                loader=FileSystemLoader("templates"),
+                autoescape=select_autoescape()
+            )
+        return self._jinja_env
 
     
     def get_uuid_from_id(self, id: str) -> str:
@@ -82,7 +92,8 @@ class OAuthManager:
         
         return auth_data
 
-    async def handle_oauth_callback(self, request: web.Request) -> web.Response:
+    async def handle_oauth_callback(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
         query_params = request.query
         
         if "error" in query_params:
@@ -122,8 +133,11 @@ class OAuthManager:
             tokens = await loop.run_in_executor(None, self.exchange_code_for_tokens, code)
             access_token = tokens["access_token"]
             refresh_token = tokens.get("refresh_token")
-            expires_in = tokens.get("expires_in", 0)       
-            self.tokens_store_function(
+            expires_in = tokens.get("expires_in", 0)
+            # Storing tokens validates them against the Webex API, keep it off the event loop
+            await loop.run_in_executor(
+                None,
+                self.tokens_store_function,
                 room_id,
                 state,
                 access_token,
@@ -150,6 +164,8 @@ class OAuthManager:
             )
 
     async def _start_http_server(self) -> None:
+        # Import off the loop, so the import overlaps with the rest of startup
+        web = await asyncio.to_thread(importlib.import_module, "aiohttp.web")
         app = web.Application()
         app.router.add_get(self.callback_path, self.handle_oauth_callback)
         
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""RateLimiter - Token buckets that pace Webex API calls below the rate limit.
+
+Each key (an org, the bot token) gets its own bucket. Callers wait for a token
+instead of sending a request the API would reject, and a 429 response blocks
+the key for the Retry-After duration. The admin clients and the bot's
+WebexTeamsAPI session share one limiter.
+"""
+
+import asyncio
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+# Retry-After to assume when a 429 response doesn't carry one
+DEFAULT_RETRY_AFTER = 5.0
+
+
+def parse_retry_after(headers) -> float:
+    """Seconds to wait according to a response's Retry-After header."""
+    try:
+        return max(float((headers or {}).get("Retry-After", DEFAULT_RETRY_AFTER)), 0.0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class RateLimiter:
+    """Per-key token buckets, refilled at `rate` requests per second up to `burst`."""
+
+    def __init__(self, rate: float = 5.0, burst: int = 20, max_retries: int = 3):
+        """Initialize rate limiter.
+
+        Args:
+            rate: Sustained requests per second per key
+            burst: Requests a key may send at once after being idle
+            max_retries: Times a request rejected with 429 is queued again
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self._buckets: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str, now: float) -> dict:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = {"tokens": float(self.burst), "updated": now, "blocked_until": 0.0,
+                      "waited": 0.0, "throttles": 0}
+            self._buckets[key] = bucket
+        bucket["tokens"] = min(float(self.burst), bucket["tokens"] + (now - bucket["updated"]) * self.rate)
+        bucket["updated"] = now
+        return bucket
+
+    def reserve(self, key: str) -> float:
+        """Take a token for a request, returning how many seconds to wait before sending it.
+
+        Tokens may go negative, so concurrent callers queue up behind each other.
+        """
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(key, now)
+            bucket["tokens"] -= 1
+            wait = max(0.0, -bucket["tokens"] / self.rate, bucket["blocked_until"] - now)
+            bucket["waited"] += wait
+            return wait
+
+    def acquire(self, key: str) -> None:
+        """Block the calling thread until a request for the key may be sent."""
+        wait = self.reserve(key)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, key: str) -> None:
+        """Wait, without blocking the loop, until a request for the key may be sent."""
+        wait = self.reserve(key)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def throttled(self, key: str, retry_after: float) -> None:
+        """Record a 429 response, holding back the key's requests for `retry_after` seconds."""
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(key, now)
+            bucket["blocked_until"] = max(bucket["blocked_until"], now + retry_after)
+            # Resume at the sustained rate rather than with a burst
+            bucket["tokens"] = min(bucket["tokens"], 0.0)
+            bucket["throttles"] += 1
+        print(f"Rate limited on {key}, holding requests for {retry_after:.1f}s")
+
+    def stats(self) -> dict:
+        """Current budget and throttling per key."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                key: {
+                    "budget": max(self._bucket(key, now)["tokens"], 0.0),
+                    "throttled_for": max(bucket["blocked_until"] - now, 0.0),
+                    "waited": bucket["waited"],
+                    "throttles": bucket["throttles"],
+                }
+                for key, bucket in list(self._buckets.items())
+            }
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """requests transport adapter pacing every request of a session through a RateLimiter key."""
+
+    def __init__(self, limiter: RateLimiter, key: str, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = limiter
+        self.key = key
+
+    def send(self, request, **kwargs):
+        self.limiter.acquire(self.key)
+        response = super().send(request, **kwargs)
+        if response.status_code == 429:
+            self.limiter.throttled(self.key, parse_retry_after(response.headers))
+        return response
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""BackgroundSaver - Coalesces storage saves on a background thread.
+
+Callers mark what they changed in the storage and request a save. Requests
+arriving within the coalescing window are written together by a single call
+to the save function, away from the event loop and the handler threads.
+
+The save runs on the saver thread while handlers keep going, so rooms and orgs
+changed in place have to be changed while holding the storage's lock.
+"""
+
+import threading
+import time
+
+
+class BackgroundSaver:
+    """Runs a save function at most once per window while changes keep coming in."""
+
+    def __init__(self, save_function, delay: float = 2.0, retry_delay: float = 30.0):
+        """Initialize saver and start its thread.
+
+        Args:
+            save_function: Persists all pending changes, e.g. StorageManager.save
+            delay: Seconds to collect further requests before saving
+            retry_delay: Seconds to wait before retrying a failed save
+        """
+        self.save_function = save_function
+        self.delay = delay
+        self.retry_delay = retry_delay
+        self._condition = threading.Condition()
+        self._pending = False
+        self._stopping = False
+        self._requested = 0
+        self._saves = 0
+        self._failures = 0
+        self._thread = threading.Thread(target=self._run, name="storage-saver", daemon=True)
+        self._thread.start()
+
+    def request(self) -> None:
+        """Schedule a save of the changes made so far."""
+        with self._condition:
+            self._requested += 1
+            if not self._pending:
+                self._pending = True
+                self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                # Let more changes pile up, unless stopping cuts the window short
+                deadline = time.monotonic() + self.delay
+                while not self._stopping and (remaining := deadline - time.monotonic()) > 0:
+                    self._condition.wait(remaining)
+                if self._stopping:
+                    return
+                self._pending = False
+            if not self._save():
+                with self._condition:
+                    self._pending = True
+                    self._condition.wait(self.retry_delay)
+
+    def _save(self) -> bool:
+        try:
+            self.save_function()
+        except Exception as e:
+            self._failures += 1
+            print(f"Saving bot state failed: {e}")
+            return False
+        self._saves += 1
+        return True
+
+    def stats(self) -> dict:
+        """Counters of save requests, completed saves and failures."""
+        with self._condition:
+            return {"requested": self._requested, "saves": self._saves, "failures": self._failures}
+
+    def stop(self) -> None:
+        """Stop the thread and write whatever is still pending."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self._save()
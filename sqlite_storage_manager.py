@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""SQLiteStorageManager - StorageManager backed by a SQLite database.
+
+This module provides the same storage interface as StorageManager, with:
+1. Rooms, their authorized users and org credentials in indexed tables
+2. Rooms and orgs loaded lazily on first access, then kept in memory
+3. Transactional saves that only write the rows that changed
+4. A one-time import of an existing JSON data file (old formats included)
+"""
+
+import json
+from pathlib import Path
+import sqlite3
+import threading
+
+from storage_manager import StorageManager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    room_id TEXT PRIMARY KEY,
+    room_name TEXT,
+    admin_email TEXT,
+    admin_id TEXT,
+    org_id TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS rooms_org_id ON rooms (org_id);
+CREATE TABLE IF NOT EXISTS room_authorized_users (
+    room_id TEXT NOT NULL REFERENCES rooms (room_id) ON DELETE CASCADE,
+    person_id TEXT NOT NULL,
+    PRIMARY KEY (room_id, person_id)
+);
+CREATE INDEX IF NOT EXISTS room_authorized_users_person_id ON room_authorized_users (person_id);
+CREATE TABLE IF NOT EXISTS orgs (
+    org_id TEXT PRIMARY KEY,
+    org_name TEXT,
+    oauth_tokens TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteStorageManager:
+    """Manages bot storage in SQLite, interchangeable with StorageManager."""
+
+    def __init__(self, dbLocation: Path, import_from: Path | None = None):
+        """Initialize storage manager.
+
+        Args:
+            dbLocation: Path of the SQLite database
+            import_from: JSON data file to import once, unless the database already imported one
+        """
+        self._dbLocation = Path(dbLocation)
+        self._conn = sqlite3.connect(self._dbLocation, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._rooms: dict[str, dict] = {}
+        self._orgs: dict[str, dict] = {}
+        self._all_rooms_loaded = False
+        self._all_orgs_loaded = False
+        self._dirty_rooms: set[str] = set()
+        self._dirty_orgs: set[str] = set()
+
+        if import_from and Path(import_from).exists() and not self._imported():
+            self._import_json(Path(import_from))
+
+    def _imported(self) -> bool:
+        # An emptied database stays empty, the old JSON file is not imported again
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'imported_from'").fetchone()
+        return row is not None
+
+    def _import_json(self, location: Path) -> None:
+        """Copy every room and org of a JSON data file into the database."""
+        # StorageManager already migrates old JSON layouts while loading
+        legacy = StorageManager(fileLocation=location)
+        with self._lock:
+            for room in legacy.get_rooms():
+                self._rooms[room["room_id"]] = room
+                self._dirty_rooms.add(room["room_id"])
+            for org in legacy.get_orgs():
+                self._orgs[org["org_id"]] = org
+                self._dirty_orgs.add(org["org_id"])
+            self.save()
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('imported_from', ?)", (str(location),)
+                )
+        print(f"Imported {len(self._rooms)} rooms and {len(self._orgs)} orgs from {location}")
+
+    def _room_from_row(self, row) -> dict:
+        room_id, room_name, admin_email, admin_id, org_id = row
+        users = {
+            person_id for (person_id,) in self._conn.execute(
+                "SELECT person_id FROM room_authorized_users WHERE room_id = ?", (room_id,)
+            )
+        }
+        return {
+            "room_id": room_id,
+            "room_name": room_name,
+            "room_admin": {
+                "email": admin_email,
+                "id": admin_id
+            },
+            "room_authorized_users": users,
+            "managed_org": {"org_id": org_id}
+        }
+
+    @staticmethod
+    def _org_from_row(row) -> dict:
+        org_id, org_name, oauth_tokens = row
+        return {"org_id": org_id, "org_name": org_name, "oauth_tokens": json.loads(oauth_tokens or "{}")}
+
+    @property
+    def lock(self):
+        """Lock held while rooms and orgs are written, hold it to change one in place."""
+        return self._lock
+
+    def mark_room_dirty(self, room_id: str) -> None:
+        """Record that a room was changed in place, so the next save persists it."""
+        with self._lock:
+            self._dirty_rooms.add(room_id)
+
+    def mark_org_dirty(self, org_id: str) -> None:
+        """Record that an org was changed in place, so the next save persists it."""
+        with self._lock:
+            self._dirty_orgs.add(org_id)
+
+    def save(self) -> None:
+        """Write changed rooms and orgs in a single transaction."""
+        with self._lock, self._conn:
+            for room_id in self._dirty_rooms:
+                room = self._rooms.get(room_id)
+                if room is None:
+                    self._conn.execute("DELETE FROM rooms WHERE room_id = ?", (room_id,))
+                    continue
+                room_admin = room.get("room_admin") or {}
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rooms (room_id, room_name, admin_email, admin_id, org_id) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        room_id,
+                        room.get("room_name"),
+                        room_admin.get("email"),
+                        room_admin.get("id"),
+                        (room.get("managed_org") or {}).get("org_id", "")
+                    )
+                )
+                self._conn.execute("DELETE FROM room_authorized_users WHERE room_id = ?", (room_id,))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO room_authorized_users (room_id, person_id) VALUES (?, ?)",
+                    [(room_id, person_id) for person_id in room.get("room_authorized_users") or ()]
+                )
+            for org_id in self._dirty_orgs:
+                org = self._orgs.get(org_id)
+                if org is None:
+                    self._conn.execute("DELETE FROM orgs WHERE org_id = ?", (org_id,))
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO orgs (org_id, org_name, oauth_tokens) VALUES (?, ?, ?)",
+                    (org_id, org.get("org_name"), json.dumps(org.get("oauth_tokens") or {}))
+                )
+            self._dirty_rooms.clear()
+            self._dirty_orgs.clear()
+
+    def compact(self) -> None:
+        """Write pending changes. Kept for interface compatibility with StorageManager."""
+        self.save()
+
+    def get_rooms(self) -> list:
+        """Get all rooms.
+
+        Returns:
+            List of room dictionaries
+        """
+        with self._lock:
+            if not self._all_rooms_loaded:
+                for row in self._conn.execute(
+                    "SELECT room_id, room_name, admin_email, admin_id, org_id FROM rooms"
+                ).fetchall():
+                    if row[0] not in self._rooms and row[0] not in self._dirty_rooms:
+                        self._rooms[row[0]] = self._room_from_row(row)
+                self._all_rooms_loaded = True
+            return list(self._rooms.values())
+
+    def get_room(self, room_id: str) -> dict | None:
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is not None or self._all_rooms_loaded or room_id in self._dirty_rooms:
+                return room
+            row = self._conn.execute(
+                "SELECT room_id, room_name, admin_email, admin_id, org_id FROM rooms WHERE room_id = ?",
+                (room_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            room = self._room_from_row(row)
+            self._rooms[room_id] = room
+            return room
+
+    def add_room(self, room_id: str, room_name, room_admin_email=None, room_admin_id=None) -> dict:
+        """Add a new room to storage."""
+        room = {
+            "room_id": room_id,
+            "room_name": room_name,
+            "room_admin": {
+                "email": room_admin_email,
+                "id": room_admin_id
+            },
+            "room_authorized_users": set(),
+            "managed_org": {}
+        }
+        with self._lock:
+            self._rooms[room_id] = room
+            self._dirty_rooms.add(room_id)
+        return room
+
+    def remove_room(self, room_id: str) -> bool:
+        """Remove a room from storage."""
+        with self._lock:
+            if self.get_room(room_id) is None:
+                return False
+            del self._rooms[room_id]
+            self._dirty_rooms.add(room_id)
+            return True
+
+    def get_orgs(self) -> list:
+        """Get all orgs with stored credentials.
+
+        Returns:
+            List of org dictionaries
+        """
+        with self._lock:
+            if not self._all_orgs_loaded:
+                for row in self._conn.execute("SELECT org_id, org_name, oauth_tokens FROM orgs").fetchall():
+                    if row[0] not in self._orgs and row[0] not in self._dirty_orgs:
+                        self._orgs[row[0]] = self._org_from_row(row)
+                self._all_orgs_loaded = True
+            return list(self._orgs.values())
+
+    def get_org(self, org_id: str) -> dict | None:
+        with self._lock:
+            org = self._orgs.get(org_id)
+            if org is not None or self._all_orgs_loaded or org_id in self._dirty_orgs:
+                return org
+            row = self._conn.execute(
+                "SELECT org_id, org_name, oauth_tokens FROM orgs WHERE org_id = ?", (org_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            org = self._org_from_row(row)
+            self._orgs[org_id] = org
+            return org
+
+    def set_org(self, org_id: str, org_name: str) -> dict:
+        """Get or create an org entry, updating its name."""
+        with self._lock:
+            org = self.get_org(org_id)
+            if org is None:
+                org = {"org_id": org_id, "org_name": org_name, "oauth_tokens": {}}
+                self._orgs[org_id] = org
+            else:
+                org["org_name"] = org_name
+            self._dirty_orgs.add(org_id)
+            return org
+
+    def get_org_for_room(self, room_id: str) -> dict | None:
+        """Get the org a room is linked to."""
+        room = self.get_room(room_id)
+        if not room:
+            return None
+        return self.get_org((room.get("managed_org") or {}).get("org_id", ""))
+
+    def get_rooms_for_person(self, person_id: str) -> list:
+        """Get the IDs of rooms where a person is an authorized user."""
+        with self._lock:
+            # Rooms changed since the last save are answered from memory, the rest from the database
+            rooms = {
+                room_id for (room_id,) in self._conn.execute(
+                    "SELECT room_id FROM room_authorized_users WHERE person_id = ?", (person_id,)
+                )
+                if room_id not in self._dirty_rooms
+            }
+            for room_id in self._dirty_rooms:
+                room = self._rooms.get(room_id)
+                if room is not None and person_id in (room.get("room_authorized_users") or ()):
+                    rooms.add(room_id)
+            return sorted(rooms)
+
+    def prune_orgs(self) -> list:
+        """Remove orgs no room links to anymore.
+
+        Returns:
+            List of removed org IDs
+        """
+        with self._lock:
+            # Rooms and orgs in memory may hold unsaved changes, the database covers the rest
+            linked = {
+                org_id for (room_id, org_id) in self._conn.execute("SELECT room_id, org_id FROM rooms")
+                if room_id not in self._rooms and room_id not in self._dirty_rooms
+            }
+            linked.update((room.get("managed_org") or {}).get("org_id") for room in self._rooms.values())
+            orgs = {
+                org_id for (org_id,) in self._conn.execute("SELECT org_id FROM orgs")
+                if org_id not in self._dirty_orgs
+            }
+            orgs.update(self._orgs)
+            removed = sorted(orgs - linked)
+            for org_id in removed:
+                self._orgs.pop(org_id, None)
+                self._dirty_orgs.add(org_id)
+            return removed
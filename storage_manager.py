@@ -5,24 +5,61 @@ This module provides a centralized storage interface that:
 1. Stores bot configuration and room data in nested JSON format
 2. Migrates from old flat format to new nested format transparently
 3. Provides data accessors that maintain compatibility with existing code
+4. Keeps OAuth credentials and org metadata once per org, referenced by rooms
+5. Persists changes incrementally to an append-only journal, periodically
+   compacted into an atomically replaced snapshot
+6. Holds each room's authorized users as a set, indexed by person
+
+On disk, authorized users are stored as sorted lists.
+
+On disk, `bot_data.json` is the snapshot and `bot_data.json.journal` holds one
+JSON line per changed room or org since the last compaction. Loading replays
+the journal on top of the snapshot.
 """
 
 import json
+import os
 from pathlib import Path
+import threading
+
+
+def _encode(value):
+    """JSON encoder for values json can't serialize, i.e. sets of authorized users."""
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 
 class StorageManager:
     """Manages bot local storage with format migration support."""
 
-    def __init__(self, fileLocation: Path):
-        """Initialize storage manager."""
-        self._fileLocation = fileLocation
+    def __init__(self, fileLocation: Path, compact_every: int = 1000):
+        """Initialize storage manager.
+
+        Args:
+            fileLocation: Path of the JSON snapshot
+            compact_every: Compact the journal into the snapshot after this many entries
+        """
+        self._fileLocation = Path(fileLocation)
+        self._journalLocation = self._fileLocation.with_name(self._fileLocation.name + ".journal")
+        self._compact_every = compact_every
+        self._journal_entries = 0
+        self._dirty_rooms: set[str] = set()
+        self._dirty_orgs: set[str] = set()
+        self._lock = threading.RLock()
+        # Serializes journal appends and compactions, which run without holding _lock
+        self._write_lock = threading.RLock()
+        # person_id -> IDs of rooms where the person is an authorized user
+        self._person_rooms: dict[str, set[str]] = {}
+        self._indexed_users: dict[str, frozenset] = {}
         self._data = {}
         with open(fileLocation) as f:
             try:
                 self._data = json.load(f)
             except json.JSONDecodeError:
                 self._data = {}
+        self._replay_journal()
+        migrated = False
 
         # Migration: Ensure rooms is a dictionary
         rooms = self._data.get("rooms")
@@ -36,11 +73,155 @@ class StorageManager:
                 if rid:
                     rooms_dict[rid] = room
             self._data["rooms"] = rooms_dict
+            migrated = True
+
+        # Migration: Move per-room credentials to the org they belong to
+        if "orgs" not in self._data:
+            self._data["orgs"] = {}
+        for room in self._data["rooms"].values():
+            managed_org = room.get("managed_org") or {}
+            org_id = managed_org.get("org_id", "")
+            tokens = managed_org.get("oauth_tokens")
+            if org_id and (tokens or managed_org.get("org_name")):
+                org = self._data["orgs"].setdefault(org_id, {"org_id": org_id, "org_name": "", "oauth_tokens": {}})
+                org["org_name"] = managed_org.get("org_name") or org["org_name"]
+                # Several rooms may hold tokens for the same org, keep the one that lasts longest
+                if tokens and tokens.get("expires_at", "") >= org["oauth_tokens"].get("expires_at", ""):
+                    org["oauth_tokens"] = tokens
+            if managed_org != {"org_id": org_id}:
+                room["managed_org"] = {"org_id": org_id}
+                migrated = True
+
+        for room_id, room in self._data["rooms"].items():
+            room["room_authorized_users"] = set(room.get("room_authorized_users") or ())
+            self._index_room(room_id)
+
+        if migrated:
+            # Persist the migrated format right away
+            self.compact()
+
+    def _replay_journal(self) -> None:
+        """Apply journal entries written since the last snapshot."""
+        if not self._journalLocation.exists():
+            return
+        with open(self._journalLocation) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-append leaves a truncated last line
+                    print(f"Skipping corrupt journal entry in {self._journalLocation}")
+                    continue
+                section = self._data.setdefault("rooms" if entry["kind"] == "room" else "orgs", {})
+                if isinstance(section, list):
+                    continue
+                if entry["value"] is None:
+                    section.pop(entry["id"], None)
+                else:
+                    section[entry["id"]] = entry["value"]
+                self._journal_entries += 1
+
+    def _index_room(self, room_id: str) -> None:
+        """Bring the person -> rooms index in line with a room's authorized users."""
+        room = self._data.get("rooms", {}).get(room_id)
+        users = frozenset(room.get("room_authorized_users") or ()) if room else frozenset()
+        previous = self._indexed_users.get(room_id, frozenset())
+        for person_id in previous - users:
+            rooms = self._person_rooms.get(person_id)
+            if rooms is not None:
+                rooms.discard(room_id)
+                if not rooms:
+                    del self._person_rooms[person_id]
+        for person_id in users - previous:
+            self._person_rooms.setdefault(person_id, set()).add(room_id)
+        if users:
+            self._indexed_users[room_id] = users
+        else:
+            self._indexed_users.pop(room_id, None)
+
+    @property
+    def lock(self):
+        """Lock held while rooms and orgs are encoded, hold it to change one in place."""
+        return self._lock
+
+    def mark_room_dirty(self, room_id: str) -> None:
+        """Record that a room was changed in place, so the next save persists it."""
+        with self._lock:
+            self._dirty_rooms.add(room_id)
+            self._index_room(room_id)
+
+    def mark_org_dirty(self, org_id: str) -> None:
+        """Record that an org was changed in place, so the next save persists it."""
+        with self._lock:
+            self._dirty_orgs.add(org_id)
+
+    def _take_dirty(self) -> tuple[set, set]:
+        dirty = self._dirty_rooms, self._dirty_orgs
+        self._dirty_rooms, self._dirty_orgs = set(), set()
+        return dirty
+
+    def _restore_dirty(self, rooms: set, orgs: set) -> None:
+        """Mark changes taken by a failed write dirty again, so the next save retries them."""
+        with self._lock:
+            self._dirty_rooms |= rooms
+            self._dirty_orgs |= orgs
 
     def save(self) -> None:
-        """Save data to JSON file."""
-        with open(self._fileLocation, "w") as f:
-            json.dump(self._data, f, indent=4)
+        """Append changed rooms and orgs to the journal, compacting when it grows large."""
+        with self._write_lock:
+            # Encoded under the lock handlers change rooms with, written without holding it
+            with self._lock:
+                rooms, orgs = self._take_dirty()
+                entries = [
+                    {"kind": "room", "id": room_id, "value": self.get_room(room_id)}
+                    for room_id in rooms
+                ] + [
+                    {"kind": "org", "id": org_id, "value": self.get_org(org_id)}
+                    for org_id in orgs
+                ]
+                lines = "".join(json.dumps(entry, separators=(",", ":"), default=_encode) + "\n" for entry in entries)
+            if entries:
+                try:
+                    with open(self._journalLocation, "a") as f:
+                        f.write(lines)
+                        f.flush()
+                        os.fsync(f.fileno())
+                except OSError:
+                    self._restore_dirty(rooms, orgs)
+                    raise
+                self._journal_entries += len(entries)
+            if self._journal_entries >= self._compact_every:
+                self.compact()
+
+    def compact(self) -> None:
+        """Write the full state to a new snapshot, atomically replace the old one and reset the journal."""
+        with self._write_lock:
+            with self._lock:
+                rooms, orgs = self._take_dirty()
+                snapshot = json.dumps(self._data, indent=4, default=_encode)
+            try:
+                tmp_location = self._fileLocation.with_name(self._fileLocation.name + ".tmp")
+                with open(tmp_location, "w") as f:
+                    f.write(snapshot)
+                    f.flush()
+                    os.fsync(f.fileno())
+                try:
+                    os.replace(tmp_location, self._fileLocation)
+                except OSError as e:
+                    # A file bind-mounted on its own (e.g. in Docker) cannot be renamed over
+                    print(f"Could not atomically replace {self._fileLocation} ({e}), writing in place")
+                    with open(self._fileLocation, "w") as f:
+                        f.write(snapshot)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.remove(tmp_location)
+            except OSError:
+                self._restore_dirty(rooms, orgs)
+                raise
+            # The snapshot now contains everything the journal did
+            if self._journalLocation.exists():
+                os.remove(self._journalLocation)
+            self._journal_entries = 0
 
     def get_rooms(self) -> list:
         """Get all rooms.
@@ -52,9 +233,6 @@ class StorageManager:
 
     def add_room(self, room_id: str, room_name, room_admin_email=None, room_admin_id=None) -> dict:
         """Add a new room to storage."""
-        if "rooms" not in self._data:
-            self._data["rooms"] = {}
-
         room = {
             "room_id": room_id,
             "room_name": room_name,
@@ -62,19 +240,74 @@ class StorageManager:
                 "email": room_admin_email,
                 "id": room_admin_id
             },
-            "room_authorized_users": [],
+            "room_authorized_users": set(),
             "managed_org": {}
         }
-        self._data["rooms"][room_id] = room
+        with self._lock:
+            self._data.setdefault("rooms", {})[room_id] = room
+            self.mark_room_dirty(room_id)
         return room
 
     def remove_room(self, room_id: str) -> bool:
         """Remove a room from storage."""
-        rooms = self._data.get("rooms", {})
-        if room_id in rooms:
-            del rooms[room_id]
-            return True
-        return False
+        with self._lock:
+            rooms = self._data.get("rooms", {})
+            if room_id in rooms:
+                del rooms[room_id]
+                self.mark_room_dirty(room_id)
+                return True
+            return False
 
     def get_room(self, room_id: str) -> dict | None:
         return self._data.get("rooms", {}).get(room_id)
+
+    def get_rooms_for_person(self, person_id: str) -> list:
+        """Get the IDs of rooms where a person is an authorized user."""
+        with self._lock:
+            return sorted(self._person_rooms.get(person_id, ()))
+
+    def get_orgs(self) -> list:
+        """Get all orgs with stored credentials.
+
+        Returns:
+            List of org dictionaries
+        """
+        return list(self._data.get("orgs", {}).values())
+
+    def get_org(self, org_id: str) -> dict | None:
+        return self._data.get("orgs", {}).get(org_id)
+
+    def set_org(self, org_id: str, org_name: str) -> dict:
+        """Get or create an org entry, updating its name."""
+        with self._lock:
+            orgs = self._data.setdefault("orgs", {})
+            org = orgs.get(org_id)
+            if org is None:
+                org = {"org_id": org_id, "org_name": org_name, "oauth_tokens": {}}
+                orgs[org_id] = org
+            else:
+                org["org_name"] = org_name
+            self.mark_org_dirty(org_id)
+            return org
+
+    def get_org_for_room(self, room_id: str) -> dict | None:
+        """Get the org a room is linked to."""
+        room = self.get_room(room_id)
+        if not room:
+            return None
+        return self.get_org((room.get("managed_org") or {}).get("org_id", ""))
+
+    def prune_orgs(self) -> list:
+        """Remove orgs no room links to anymore.
+
+        Returns:
+            List of removed org IDs
+        """
+        with self._lock:
+            linked = {(room.get("managed_org") or {}).get("org_id") for room in self.get_rooms()}
+            orgs = self._data.get("orgs", {})
+            removed = [org_id for org_id in orgs if org_id not in linked]
+            for org_id in removed:
+                del orgs[org_id]
+                self.mark_org_dirty(org_id)
+            return removed
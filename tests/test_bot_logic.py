@@ -9,6 +9,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Mock dependencies that might be imported at module level or problematic
 sys.modules['helper'] = MagicMock()
 sys.modules['oauth_manager'] = MagicMock()
+sys.modules['sqlite_storage_manager'] = MagicMock()
 sys.modules['storage_manager'] = MagicMock()
 sys.modules['webex_utils'] = MagicMock()
 sys.modules['webex_admin'] = MagicMock()
@@ -38,7 +39,7 @@ class TestBotLogic(unittest.TestCase):
 
                 # Mock storage.get_room to return a valid room dict
                 self.mock_room = {
-                    'room_authorized_users': [],
+                    'room_authorized_users': set(),
                     'managed_org': {},
                     'room_admin': {}
                 }
@@ -201,5 +202,294 @@ class TestBotLogic(unittest.TestCase):
         # Also ensure we didn't add @Bot or @User strings as users (they don't have dots)
 
 
+    def test_authorized_users_change_under_storage_lock(self):
+        import threading
+        lock = threading.Lock()
+        self.mock_storage.lock = lock
+        test = self
+
+        class CheckedSet(set):
+            def add(self, item):
+                test.assertTrue(lock.locked(), "changed while the saver may be encoding the room")
+                super().add(item)
+
+            def discard(self, item):
+                test.assertTrue(lock.locked(), "changed while the saver may be encoding the room")
+                super().discard(item)
+
+        self.mock_room['room_authorized_users'] = CheckedSet()
+        m = MagicMock()
+        m.personId = "user_id_123"
+        self.mock_api.memberships.list.return_value = [m]
+
+        self.assertTrue(self.bot.add_allowed_user("room123", "user@example.com"))
+        self.assertTrue(self.bot.remove_allowed_user("room123", "user@example.com"))
+        self.assertEqual(self.mock_room['room_authorized_users'], set())
+        self.mock_storage.mark_room_dirty.assert_called_with("room123")
+
+    def test_cached_admin_is_shared_per_org_with_its_refresher_bound_once(self):
+        org = {'org_id': 'org1', 'oauth_tokens': {'access_token': 'token1'}}
+        self.mock_storage.get_org.return_value = org
+        room1 = {'room_id': 'room1', 'managed_org': {'org_id': 'org1'}}
+        room2 = {'room_id': 'room2', 'managed_org': {'org_id': 'org1'}}
+        admin = MagicMock()
+        admin.my_token = 'token1'
+        self.bot.tokens.get_access_token = MagicMock(return_value='token1')
+        self.bot._run_coro = MagicMock(return_value=admin)
+
+        with patch('bot_ws.AsyncWebexAdmin') as admin_class:
+            self.assertIs(self.bot._admin_for_room(room1), admin)
+            self.bot.tokens.get_access_token.return_value = 'token2'
+            self.assertIs(self.bot._admin_for_room(room2), admin)
+
+        admin_class.create.assert_called_once()
+        # The second room switched the shared client's token without replacing its refresher
+        admin.set_token.assert_called_once_with('token2')
+        self.bot.tokens.refresh = MagicMock(return_value='token3')
+        self.assertEqual(admin_class.create.call_args.kwargs['token_refresher'](), 'token3')
+        self.bot.tokens.refresh.assert_called_once_with('org1', org, stale_token='token1')
+
+    def test_admin_after_authorization_refreshes_rejected_requests(self):
+        org = {'org_id': 'org1'}
+        self.mock_storage.set_org.return_value = org
+        self.mock_storage.get_org.return_value = org
+        validating_admin = MagicMock()
+        validating_admin.org_id = 'org1'
+        admin = MagicMock()
+        self.bot._run_coro = MagicMock(side_effect=[validating_admin, True, admin])
+
+        with patch('bot_ws.AsyncWebexAdmin') as admin_class:
+            self.bot.store_tokens("room123", "state", "token1", "refresh1", "2030-01-01T00:00:00+00:00")
+            self.assertIs(self.bot._admin_for_room(self.mock_room), admin)
+
+        self.assertEqual(admin_class.create.call_count, 2)
+        self.bot.tokens.refresh = MagicMock(return_value='token2')
+        self.assertEqual(admin_class.create.call_args.kwargs['token_refresher'](), 'token2')
+        self.bot.tokens.refresh.assert_called_once_with('org1', org, stale_token='token1')
+
+    def test_repeated_lookups_are_cached(self):
+        m = MagicMock()
+        m.personId = "user_id_123"
+        m.personEmail = "user@example.com"
+        self.mock_api.memberships.list.return_value = [m]
+        self.mock_api.memberships.list.reset_mock()
+
+        self.assertEqual(self.bot.get_email_from_id("user_id_123", "room123"), "user@example.com")
+        self.assertEqual(self.bot.get_id_from_email("user@example.com", "room123"), "user_id_123")
+        self.assertEqual(self.bot.get_email_from_id("user_id_123", "room123"), "user@example.com")
+        self.assertEqual(self.mock_api.memberships.list.call_count, 1)
+
+    def test_unauthorized_post_is_not_fetched(self):
+        self.mock_room['room_admin'] = {'email': 'admin@example.com', 'id': 'admin_id'}
+        activity = {"id": "a1", "actor": {"id": "stranger"}, "target": {"id": "room"}}
+        with patch('bot_ws.webex_utils.is_bot_id', return_value=False), \
+             patch('bot_ws.webex_utils.extract_person_id_from_actor', return_value="stranger_id"):
+            self.bot._handle_message_event(activity)
+        self.mock_api.messages.get.assert_not_called()
+        self.assertEqual(self.bot.event_counts["post_skipped_unauthorized"], 1)
+        # Skipped without a rejection notice
+        self.assertEqual(self.bot.messenger.stats()['queued'], 0)
+
+    def test_first_user_becomes_admin_only_once_the_post_is_fetched(self):
+        activity = {"id": "a1", "actor": {"id": "someone"}, "target": {"id": "room"}}
+        message = MagicMock(personId="someone_id", roomId="room123", text="")
+
+        def get_message(message_id):
+            # Nothing happens to the room for a post that may not be addressed to the bot
+            self.bot.set_room_admin.assert_not_called()
+            return message
+
+        self.mock_api.messages.get.side_effect = get_message
+        self.bot.set_room_admin = MagicMock()
+        self.bot.get_email_from_id = MagicMock(return_value="someone@example.com")
+        with patch('bot_ws.webex_utils.is_bot_id', return_value=False), \
+             patch('bot_ws.webex_utils.extract_person_id_from_actor', return_value="someone_id"):
+            self.bot._handle_message_event(activity)
+        self.mock_api.messages.get.assert_called_once()
+        self.bot.set_room_admin.assert_called_once_with("room123", "someone@example.com")
+
+    def test_own_post_is_not_fetched(self):
+        activity = {"id": "a1", "actor": {"id": "bot"}, "target": {"id": "room"}}
+        with patch('bot_ws.webex_utils.is_bot_id', return_value=True):
+            self.bot._handle_message_event(activity)
+        self.mock_api.messages.get.assert_not_called()
+        self.assertEqual(self.bot.event_counts["post_skipped_own"], 1)
+
+    def test_reconcile_prunes_left_rooms_and_defers_new_ones(self):
+        self.mock_storage.get_rooms.return_value = [{'room_id': 'gone'}, {'room_id': 'kept'}]
+        memberships = []
+        for room_id in ('kept', 'new'):
+            m = MagicMock()
+            m.roomId = room_id
+            memberships.append(m)
+        self.mock_api.memberships.list.return_value = memberships
+
+        self.bot._reconcile_rooms()
+
+        self.mock_storage.remove_room.assert_called_once_with('gone')
+        self.assertEqual(self.bot._unhydrated_rooms, {'new'})
+        self.mock_api.rooms.get.assert_not_called()
+
+    def test_reconcile_keeps_rooms_added_during_listing(self):
+        self.mock_storage.get_rooms.return_value = [{'room_id': 'kept'}]
+        kept = MagicMock()
+        kept.roomId = 'kept'
+
+        def list_memberships(**kwargs):
+            # handle_added stores a room while the listing is paging, after its page was read
+            self.mock_storage.get_rooms.return_value = [{'room_id': 'kept'}, {'room_id': 'added'}]
+            return [kept]
+
+        self.mock_api.memberships.list.side_effect = list_memberships
+
+        self.bot._reconcile_rooms()
+
+        self.mock_storage.remove_room.assert_not_called()
+
+    def test_refuses_to_start_without_sdk_request_session(self):
+        api = MagicMock()
+        api._session._req_session = None
+        with patch('bot_ws.WebexTeamsAPI', return_value=api):
+            with self.assertRaises(RuntimeError):
+                BotWS(bot_token="fake_token", storage=self.mock_storage)
+
+    def test_startup_phases_are_timed(self):
+        self.bot._device_info_future.result(timeout=2)
+        self.assertEqual({"imports", "identity", "device"}, set(self.bot.startup_timings))
+
+    def test_websocket_frames_are_classified_before_decoding(self):
+        import asyncio
+        import json
+        self.bot.dispatcher.submit = MagicMock()
+        typing_frame = json.dumps({"data": {"eventType": "status.start_typing", "actor": {"id": "p1"}}})
+        post_frame = json.dumps({"data": {"eventType": "conversation.activity", "activity": {
+            "verb": "post", "id": "a1", "target": {"id": "room"}}}})
+        with patch('bot_ws.helper.json_loads', side_effect=json.loads) as json_loads:
+            asyncio.run(self.bot._process_websocket_message(typing_frame))
+            json_loads.assert_not_called()
+            asyncio.run(self.bot._process_websocket_message(post_frame))
+        self.bot.dispatcher.submit.assert_called_once()
+        self.assertEqual(self.bot.event_counts["frame status.start_typing"], 1)
+        self.assertEqual(self.bot.event_counts["activity post"], 1)
+
+    def test_redelivered_activity_is_dropped(self):
+        import asyncio
+        import json
+        self.bot.dispatcher.submit = MagicMock()
+        frame = json.dumps({"data": {"eventType": "conversation.activity", "activity": {
+            "verb": "cardAction", "id": "a1", "target": {"id": "room"}}}})
+        with patch('bot_ws.helper.json_loads', side_effect=json.loads):
+            asyncio.run(self.bot._process_websocket_message(frame))
+            asyncio.run(self.bot._process_websocket_message(frame))
+        self.bot.dispatcher.submit.assert_called_once()
+        self.assertEqual(self.bot.event_counts["activity_duplicate"], 1)
+
+    def test_seen_activities_survive_restart(self):
+        import tempfile
+        import time
+        from pathlib import Path
+        with tempfile.TemporaryDirectory() as tmpdir:
+            location = Path(tmpdir) / "seen.json"
+            self.bot._seen_activities_location = location
+            self.bot._seen_activities.set("a1", 0)
+            self.bot._seen_activities.set("a2", time.time())
+            self.bot._save_seen_activities()
+            self.bot._seen_activities.clear()
+            self.bot._load_seen_activities()
+        # a1 was seen long ago and is outside the window
+        self.assertNotIn("a1", self.bot._seen_activities)
+        self.assertIn("a2", self.bot._seen_activities)
+
+    def test_add_several_users_posts_one_message(self):
+        m = MagicMock()
+        m.personId = "user_id_123"
+        self.mock_api.memberships.list.return_value = [m]
+        self.mock_api.messages.create.reset_mock()
+
+        message_obj = MagicMock()
+        message_obj.text = "add a@example.com b@example.com c@example.com"
+        message_obj.mentionedPeople = []
+        self.bot.handle_command(message_obj, "room123", "actor123")
+        self.bot.messenger.stop()
+
+        self.mock_api.messages.create.assert_called_once()
+        self.assertEqual(
+            self.mock_api.messages.create.call_args.kwargs["text"],
+            "Users a@example.com, b@example.com, c@example.com added successfully."
+        )
+
+    def test_add_resolves_targets_with_one_membership_listing(self):
+        members = []
+        for i in range(40):
+            m = MagicMock()
+            m.personId = f"id{i}"
+            m.personEmail = f"user{i}@example.com"
+            members.append(m)
+
+        def list_memberships(roomId=None, personId=None, personEmail=None, **kwargs):
+            return members if not personId and not personEmail else []
+
+        self.mock_api.memberships.list.side_effect = list_memberships
+        self.mock_api.memberships.list.reset_mock()
+
+        message_obj = MagicMock()
+        message_obj.text = "add " + " ".join(f"user{i}@example.com" for i in range(20, 40))
+        message_obj.mentionedPeople = [f"id{i}" for i in range(20)]
+        self.bot.handle_command(message_obj, "room123", "actor123")
+
+        self.assertEqual(self.mock_api.memberships.list.call_count, 1)
+        self.assertEqual(self.mock_room['room_authorized_users'], {f"id{i}" for i in range(40)})
+
+    def test_single_target_is_looked_up_without_listing_the_room(self):
+        m = MagicMock()
+        m.personId = "user_id_123"
+        self.mock_api.memberships.list.return_value = [m]
+        self.mock_api.memberships.list.reset_mock()
+
+        message_obj = MagicMock()
+        message_obj.text = "add user@example.com"
+        message_obj.mentionedPeople = []
+        self.bot.handle_command(message_obj, "room123", "actor123")
+
+        self.mock_api.memberships.list.assert_called_once_with(roomId="room123", personEmail="user@example.com")
+        self.assertEqual(self.mock_room['room_authorized_users'], {"user_id_123"})
+
+    def details_all(self, devices, workspaces):
+        self.mock_room['managed_org'] = {'org_id': 'org1'}
+        self.bot._admin_for_room = MagicMock()
+        self.bot._run_coro = MagicMock(side_effect=[devices, workspaces])
+        self.mock_api.messages.create.reset_mock()
+
+        def group(devices):
+            grouped = {}
+            for device in devices:
+                grouped.setdefault(device["workspaceId"], []).append(device)
+            return grouped
+
+        message_obj = MagicMock()
+        message_obj.text = "details ALL"
+        with patch('bot_ws.group_devices_by_workspace', side_effect=group):
+            self.bot.handle_command(message_obj, "room123", "actor123")
+        self.bot.messenger.stop()
+        return self.mock_api.messages.create.call_args.kwargs
+
+    def test_details_all_groups_the_inventory_per_workspace(self):
+        devices = [
+            {"workspaceId": "w1", "product": "Board 55", "connectionStatus": "connected"},
+            {"workspaceId": "w1", "product": "Room Kit", "connectionStatus": "disconnected"},
+            {"workspaceId": "w2", "product": "Desk Pro", "connectionStatus": "connected"},
+        ]
+        sent = self.details_all(devices, {"w1": "Lobby", "w2": "Office", "w3": "Empty"})
+        self.assertIn("**[Lobby]", sent["markdown"])
+        self.assertIn("has 2 devices", sent["markdown"])
+        self.assertIn("has 1 device\n", sent["markdown"])
+        self.assertIn("has 0 devices", sent["markdown"])
+        self.assertEqual(sent["markdown"].count("Board 55"), 1)
+
+    def test_details_all_reports_a_failed_inventory(self):
+        sent = self.details_all(None, {"w1": "Lobby"})
+        self.assertNotIn("markdown", sent)
+        self.assertIn("Could not list", sent["text"])
+
 if __name__ == '__main__':
     unittest.main()
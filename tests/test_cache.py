@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_entry_expires_after_ttl(self):
+        cache = TTLCache(ttl=10)
+        with patch('cache.time.monotonic', return_value=100.0):
+            cache.set("org", "admin")
+        with patch('cache.time.monotonic', return_value=105.0):
+            self.assertEqual(cache.get("org"), "admin")
+        with patch('cache.time.monotonic', return_value=110.0):
+            self.assertIsNone(cache.get("org"))
+            self.assertNotIn("org", cache)
+
+    def test_pop_invalidates(self):
+        cache = TTLCache(ttl=10)
+        cache.set("org", "admin")
+        self.assertEqual(cache.pop("org"), "admin")
+        self.assertIsNone(cache.get("org"))
+
+    def test_max_size_evicts_least_recently_used(self):
+        cache = TTLCache(ttl=10, max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+
+    def test_items_skip_expired_and_custom_ttl(self):
+        cache = TTLCache(ttl=10)
+        with patch('cache.time.monotonic', return_value=100.0):
+            cache.set("short", 1, ttl=1)
+            cache.set("long", 2)
+        with patch('cache.time.monotonic', return_value=105.0):
+            self.assertEqual(cache.items(), [("long", 2)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dispatcher import EventDispatcher
+
+
+class TestEventDispatcher(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.run(coro)
+
+    def test_same_key_runs_in_order(self):
+        dispatcher = EventDispatcher(max_workers=4)
+        seen = []
+
+        def handler(value):
+            time.sleep(0.01 * (3 - value))
+            seen.append(value)
+
+        async def scenario():
+            for value in range(3):
+                dispatcher.submit("room1", handler, value)
+            await dispatcher.drain()
+
+        self.run_async(scenario())
+        dispatcher.shutdown()
+        self.assertEqual(seen, [0, 1, 2])
+
+    def test_different_keys_run_concurrently(self):
+        dispatcher = EventDispatcher(max_workers=2)
+        barrier = threading.Barrier(2, timeout=2)
+
+        def handler():
+            # Deadlocks (and raises BrokenBarrierError) unless both rooms run at once
+            barrier.wait()
+
+        async def scenario():
+            dispatcher.submit("room1", handler)
+            dispatcher.submit("room2", handler)
+            await dispatcher.drain()
+
+        self.run_async(scenario())
+        dispatcher.shutdown()
+        self.assertEqual(dispatcher.stats()["failed"], 0)
+        self.assertEqual(dispatcher.stats()["handled"], 2)
+
+    def test_failure_is_counted_and_queue_released(self):
+        dispatcher = EventDispatcher(max_workers=1)
+
+        def failing():
+            raise ValueError("boom")
+
+        async def scenario():
+            dispatcher.submit("room1", failing)
+            await dispatcher.drain()
+
+        self.run_async(scenario())
+        dispatcher.shutdown()
+        stats = dispatcher.stats()
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["queued"], 0)
+        self.assertEqual(stats["active_keys"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from membership_cache import MembershipCache
+
+
+class TestMembershipCache(unittest.TestCase):
+    def test_lookup_both_ways(self):
+        members = MembershipCache(ttl=60)
+        members.remember("room1", "p1", "User@Example.com")
+        self.assertEqual(members.get_email("room1", "p1"), "User@Example.com")
+        self.assertEqual(members.get_id("room1", "user@example.com"), "p1")
+        self.assertIsNone(members.get_id("room2", "user@example.com"))
+        self.assertEqual((members.hits, members.misses), (2, 1))
+
+    def test_invalidate_drops_only_that_room(self):
+        members = MembershipCache(ttl=60)
+        members.remember("room1", "p1", "a@example.com")
+        members.remember("room2", "p1", "a@example.com")
+        members.invalidate("room1")
+        self.assertIsNone(members.get_email("room1", "p1"))
+        self.assertEqual(members.get_email("room2", "p1"), "a@example.com")
+
+    def test_remember_all_merges_with_cached_members(self):
+        members = MembershipCache(ttl=60)
+        members.remember("room1", "p1", "a@example.com")
+        members.remember_all("room1", [("p2", "B@example.com"), ("p3", ""), ("", "c@example.com")])
+        self.assertEqual(members.get_email("room1", "p1"), "a@example.com")
+        self.assertEqual(members.get_id("room1", "b@example.com"), "p2")
+        self.assertIsNone(members.get_email("room1", "p3"))
+
+    def test_entries_expire(self):
+        members = MembershipCache(ttl=0)
+        members.remember("room1", "p1", "a@example.com")
+        self.assertIsNone(members.get_email("room1", "p1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from messenger import OutboundMessenger
+
+
+class TestOutboundMessenger(unittest.TestCase):
+    def test_replies_are_coalesced_per_room(self):
+        api = MagicMock()
+        messenger = OutboundMessenger(api, window=60)
+        messenger.send("room1", text="one")
+        messenger.send("room1", text="two")
+        messenger.send("room2", markdown="**three**")
+        messenger.stop()
+
+        posts = {call.kwargs["roomId"]: call.kwargs for call in api.messages.create.call_args_list}
+        self.assertEqual(api.messages.create.call_count, 2)
+        self.assertEqual(posts["room1"]["text"], "one\ntwo")
+        self.assertEqual(posts["room2"]["markdown"], "**three**")
+
+    def test_post_goes_after_queued_replies(self):
+        api = MagicMock()
+        messenger = OutboundMessenger(api, window=60)
+        messenger.send("room1", text="queued")
+        messenger.post("room1", text="card", attachments=["card"])
+        messenger.stop()
+
+        texts = [call.kwargs["text"] for call in api.messages.create.call_args_list]
+        self.assertEqual(texts, ["queued", "card"])
+
+    def test_repeated_rejections_are_suppressed(self):
+        api = MagicMock()
+        messenger = OutboundMessenger(api, window=60, rejection_interval=300)
+        self.assertTrue(messenger.notify_unauthorized("room1", "p1", "no rights"))
+        self.assertFalse(messenger.notify_unauthorized("room1", "p1", "no rights"))
+        self.assertTrue(messenger.notify_unauthorized("room1", "p2", "no rights"))
+        messenger.stop()
+
+        self.assertEqual(messenger.stats()["rejections_suppressed"], 1)
+        self.assertEqual(api.messages.create.call_args.kwargs["text"], "no rights")
+
+
+    def test_failed_batch_is_retried_once(self):
+        api = MagicMock()
+        api.messages.create.side_effect = [Exception("503"), MagicMock()]
+        messenger = OutboundMessenger(api, window=60, retry_delay=0)
+        messenger.send("room1", text="code")
+        messenger.stop()
+
+        self.assertEqual(api.messages.create.call_count, 2)
+        self.assertEqual(messenger.stats()["posted"], 1)
+
+    def test_replies_queued_during_a_post_wait_for_it(self):
+        api = MagicMock()
+        posting = threading.Event()
+        release = threading.Event()
+
+        def create(**kwargs):
+            if "attachments" in kwargs:
+                posting.set()
+                self.assertTrue(release.wait(2))
+            return MagicMock()
+
+        api.messages.create.side_effect = create
+        messenger = OutboundMessenger(api, window=0)
+        poster = threading.Thread(target=messenger.post, args=("room1",), kwargs={"text": "card", "attachments": ["card"]})
+        poster.start()
+        self.assertTrue(posting.wait(2))
+        messenger.send("room1", text="reply")
+        time.sleep(0.1)
+        # The reply's window is over, but the card is still being posted
+        self.assertEqual(api.messages.create.call_count, 1)
+        release.set()
+        poster.join()
+        messenger.stop()
+
+        texts = [call.kwargs["text"] for call in api.messages.create.call_args_list]
+        self.assertEqual(texts, ["card", "reply"])
+
+if __name__ == '__main__':
+    unittest.main()
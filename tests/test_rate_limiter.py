@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter, parse_retry_after
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst_then_sustained_rate(self):
+        limiter = RateLimiter(rate=2, burst=2)
+        with patch('rate_limiter.time.monotonic', return_value=100.0):
+            self.assertEqual(limiter.reserve("org:1"), 0.0)
+            self.assertEqual(limiter.reserve("org:1"), 0.0)
+            # Queued behind each other at 2 requests per second
+            self.assertAlmostEqual(limiter.reserve("org:1"), 0.5)
+            self.assertAlmostEqual(limiter.reserve("org:1"), 1.0)
+            # Other keys have their own budget
+            self.assertEqual(limiter.reserve("bot"), 0.0)
+
+    def test_throttle_holds_key_for_retry_after(self):
+        limiter = RateLimiter(rate=10, burst=10)
+        with patch('rate_limiter.time.monotonic', return_value=100.0):
+            limiter.throttled("org:1", 3)
+            self.assertAlmostEqual(limiter.reserve("org:1"), 3.0)
+            stats = limiter.stats()["org:1"]
+        self.assertEqual(stats["throttles"], 1)
+        self.assertAlmostEqual(stats["throttled_for"], 3.0)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after({"Retry-After": "12"}), 12.0)
+        self.assertEqual(parse_retry_after({"Retry-After": "soon"}), 5.0)
+        self.assertEqual(parse_retry_after({}), 5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
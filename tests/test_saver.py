@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from saver import BackgroundSaver
+
+
+class TestBackgroundSaver(unittest.TestCase):
+    def test_requests_within_window_are_coalesced(self):
+        saved = threading.Event()
+        calls = []
+
+        def save():
+            calls.append(time.monotonic())
+            saved.set()
+
+        saver = BackgroundSaver(save, delay=0.05)
+        for _ in range(10):
+            saver.request()
+        self.assertTrue(saved.wait(2))
+        saver.stop()
+        # One save from the window, one final save on stop
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(saver.stats()["requested"], 10)
+
+    def test_stop_flushes_pending_changes(self):
+        calls = []
+        saver = BackgroundSaver(lambda: calls.append(1), delay=60)
+        saver.request()
+        saver.stop()
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_save_is_retried(self):
+        attempts = []
+        done = threading.Event()
+
+        def save():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OSError("disk full")
+            done.set()
+
+        saver = BackgroundSaver(save, delay=0.01, retry_delay=0.01)
+        saver.request()
+        self.assertTrue(done.wait(2))
+        saver.stop()
+        self.assertEqual(saver.stats()["failures"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import json
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from pathlib import Path
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# test_bot_logic replaces these modules with mocks, make sure we test the real ones
+for name in ('storage_manager', 'sqlite_storage_manager'):
+    if isinstance(sys.modules.get(name), MagicMock):
+        del sys.modules[name]
+
+from sqlite_storage_manager import SQLiteStorageManager
+
+
+class TestSQLiteStorageManager(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / "bot_data.db"
+        self.json_path = Path(self.tmpdir.name) / "bot_data.json"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def open(self, **kwargs):
+        storage = SQLiteStorageManager(dbLocation=self.db_path, **kwargs)
+        self.addCleanup(storage._conn.close)
+        return storage
+
+    def test_changes_survive_reload(self):
+        storage = self.open()
+        room = storage.add_room("r1", "Room 1", "admin@example.com", "p1")
+        room["room_authorized_users"].add("p2")
+        room["managed_org"] = {"org_id": "o1"}
+        storage.mark_room_dirty("r1")
+        org = storage.set_org("o1", "Org")
+        org["oauth_tokens"] = {"access_token": "a1", "refresh_token": "r1"}
+        storage.save()
+
+        reloaded = self.open()
+        self.assertEqual(reloaded.get_room("r1"), room)
+        self.assertEqual(reloaded.get_org_for_room("r1"), org)
+        self.assertEqual(reloaded.get_rooms_for_person("p2"), ["r1"])
+
+    def test_rooms_for_person_includes_unsaved_changes_without_saving(self):
+        storage = self.open()
+        storage.add_room("r1", "Room 1")["room_authorized_users"].add("p1")
+        storage.add_room("r2", "Room 2")["room_authorized_users"].add("p1")
+        storage.save()
+        storage.get_room("r1")["room_authorized_users"].discard("p1")
+        storage.mark_room_dirty("r1")
+        storage.add_room("r3", "Room 3")["room_authorized_users"].add("p1")
+
+        self.assertEqual(storage.get_rooms_for_person("p1"), ["r2", "r3"])
+        self.assertEqual(storage._dirty_rooms, {"r1", "r3"})
+        self.assertEqual(self.open().get_rooms_for_person("p1"), ["r1", "r2"])
+
+    def test_remove_room_and_prune_orgs(self):
+        storage = self.open()
+        storage.add_room("r1", "Room 1")["managed_org"] = {"org_id": "o1"}
+        storage.set_org("o1", "Org")
+        storage.save()
+
+        self.assertTrue(storage.remove_room("r1"))
+        self.assertFalse(storage.remove_room("r1"))
+        self.assertEqual(storage.prune_orgs(), ["o1"])
+        # Pruning leaves the writing to the next save
+        self.assertEqual(storage._dirty_orgs, {"o1"})
+        self.assertEqual(self.open().get_orgs()[0]["org_id"], "o1")
+        storage.save()
+
+        reloaded = self.open()
+        self.assertIsNone(reloaded.get_room("r1"))
+        self.assertEqual(reloaded.get_orgs(), [])
+
+    def test_imports_legacy_json_once(self):
+        tokens = {"access_token": "a1", "refresh_token": "r1", "expires_at": "2030-01-01T00:00:00"}
+        self.json_path.write_text(json.dumps({"rooms": [
+            {"room_id": "r1", "room_name": "Room 1", "room_authorized_users": ["p1"],
+             "managed_org": {"org_id": "o1", "org_name": "Org", "oauth_tokens": tokens}},
+        ]}))
+        storage = self.open(import_from=self.json_path)
+        self.assertEqual(storage.get_room("r1")["managed_org"], {"org_id": "o1"})
+        self.assertEqual(storage.get_org("o1")["oauth_tokens"], tokens)
+
+        # Later changes to the JSON file are not imported again
+        self.json_path.write_text(json.dumps({"rooms": {"r2": {"room_id": "r2"}}}))
+        reloaded = self.open(import_from=self.json_path)
+        self.assertEqual([room["room_id"] for room in reloaded.get_rooms()], ["r1"])
+
+    def test_emptied_database_does_not_import_again(self):
+        self.json_path.write_text(json.dumps({"rooms": {"r1": {
+            "room_id": "r1", "managed_org": {"org_id": "o1", "org_name": "Org", "oauth_tokens": {"access_token": "a1"}},
+        }}}))
+        storage = self.open(import_from=self.json_path)
+        storage.remove_room("r1")
+        self.assertEqual(storage.prune_orgs(), ["o1"])
+        storage.save()
+
+        reloaded = self.open(import_from=self.json_path)
+        self.assertEqual(reloaded.get_rooms(), [])
+        self.assertEqual(reloaded.get_orgs(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import json
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# test_bot_logic replaces this module with a mock, make sure we test the real one
+if isinstance(sys.modules.get('storage_manager'), MagicMock):
+    del sys.modules['storage_manager']
+
+from storage_manager import StorageManager
+
+
+class TestStorageManager(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / "bot_data.json"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, data):
+        self.path.write_text(json.dumps(data))
+
+    def test_room_list_is_migrated_to_dict(self):
+        self.write({"rooms": [{"room_id": "r1", "room_name": "Room 1"}]})
+        storage = StorageManager(fileLocation=self.path)
+        self.assertEqual(storage.get_room("r1")["room_name"], "Room 1")
+
+    def test_room_tokens_are_moved_to_org(self):
+        older = {"access_token": "a1", "refresh_token": "r1", "expires_at": "2030-01-01T00:00:00"}
+        newer = {"access_token": "a2", "refresh_token": "r2", "expires_at": "2030-02-01T00:00:00"}
+        self.write({"rooms": {
+            "r1": {"room_id": "r1", "managed_org": {"org_id": "o1", "org_name": "Org", "oauth_tokens": older}},
+            "r2": {"room_id": "r2", "managed_org": {"org_id": "o1", "org_name": "Org", "oauth_tokens": newer}},
+        }})
+        storage = StorageManager(fileLocation=self.path)
+        self.assertEqual(storage.get_room("r1")["managed_org"], {"org_id": "o1"})
+        self.assertEqual(storage.get_org_for_room("r2")["org_name"], "Org")
+        self.assertEqual(storage.get_org("o1")["oauth_tokens"], newer)
+        self.assertEqual(len(storage.get_orgs()), 1)
+
+    def test_prune_orgs_keeps_linked_orgs(self):
+        self.write({})
+        storage = StorageManager(fileLocation=self.path)
+        room = storage.add_room("r1", "Room 1")
+        room["managed_org"] = {"org_id": "o1"}
+        storage.set_org("o1", "Org 1")
+        storage.set_org("o2", "Org 2")
+        self.assertEqual(storage.prune_orgs(), ["o2"])
+        self.assertIsNotNone(storage.get_org("o1"))
+
+    def test_save_round_trip(self):
+        self.write({})
+        storage = StorageManager(fileLocation=self.path)
+        storage.add_room("r1", "Room 1")
+        storage.set_org("o1", "Org 1")
+        storage.save()
+        reloaded = StorageManager(fileLocation=self.path)
+        self.assertEqual(reloaded.get_room("r1")["room_name"], "Room 1")
+        self.assertEqual(reloaded.get_org("o1")["org_name"], "Org 1")
+
+    def test_save_appends_changes_to_journal(self):
+        self.write({})
+        storage = StorageManager(fileLocation=self.path)
+        room = storage.add_room("r1", "Room 1")
+        storage.save()
+        snapshot_before = self.path.read_text()
+        room["room_admin"]["email"] = "admin@example.com"
+        storage.mark_room_dirty("r1")
+        storage.save()
+        # Only the journal is written, the snapshot is left alone
+        self.assertEqual(self.path.read_text(), snapshot_before)
+        journal = Path(str(self.path) + ".journal").read_text().splitlines()
+        self.assertEqual(len(journal), 2)
+
+        reloaded = StorageManager(fileLocation=self.path)
+        self.assertEqual(reloaded.get_room("r1")["room_admin"]["email"], "admin@example.com")
+
+    def test_removed_room_is_replayed(self):
+        self.write({})
+        storage = StorageManager(fileLocation=self.path)
+        storage.add_room("r1", "Room 1")
+        storage.save()
+        storage.remove_room("r1")
+        storage.save()
+        self.assertIsNone(StorageManager(fileLocation=self.path).get_room("r1"))
+
+    def test_compaction_replaces_snapshot_and_clears_journal(self):
+        self.write({})
+        storage = StorageManager(fileLocation=self.path, compact_every=2)
+        storage.add_room("r1", "Room 1")
+        storage.add_room("r2", "Room 2")
+        storage.save()
+        self.assertFalse(Path(str(self.path) + ".journal").exists())
+        self.assertIn("r2", json.loads(self.path.read_text())["rooms"])
+
+    def test_truncated_journal_line_is_ignored(self):
+        self.write({})
+        storage = StorageManager(fileLocation=self.path)
+        storage.add_room("r1", "Room 1")
+        storage.save()
+        with open(str(self.path) + ".journal", "a") as f:
+            f.write('{"kind": "room", "id": "r2", "val')
+        reloaded = StorageManager(fileLocation=self.path)
+        self.assertIsNotNone(reloaded.get_room("r1"))
+        self.assertIsNone(reloaded.get_room("r2"))
+
+
+    def test_authorized_users_are_indexed_by_person(self):
+        self.write({"rooms": {"r1": {"room_id": "r1", "room_authorized_users": ["p1", "p1", "p2"]}}})
+        storage = StorageManager(fileLocation=self.path)
+        self.assertEqual(storage.get_room("r1")["room_authorized_users"], {"p1", "p2"})
+        room = storage.add_room("r2", "Room 2")
+        room["room_authorized_users"].add("p1")
+        storage.mark_room_dirty("r2")
+        self.assertEqual(storage.get_rooms_for_person("p1"), ["r1", "r2"])
+
+        storage.get_room("r1")["room_authorized_users"].discard("p1")
+        storage.mark_room_dirty("r1")
+        storage.remove_room("r2")
+        self.assertEqual(storage.get_rooms_for_person("p1"), [])
+        self.assertEqual(storage.get_rooms_for_person("p2"), ["r1"])
+
+        storage.compact()
+        self.assertEqual(json.loads(self.path.read_text())["rooms"]["r1"]["room_authorized_users"], ["p2"])
+
+    def test_journal_is_written_without_holding_the_storage_lock(self):
+        self.write({})
+        storage = StorageManager(fileLocation=self.path)
+        storage.add_room("r1", "Room 1")
+        acquired = []
+
+        def change_room():
+            if storage.lock.acquire(timeout=1):
+                acquired.append(True)
+                storage.lock.release()
+
+        def fsync(fd):
+            # A handler thread changing a room meanwhile must not wait for the disk
+            other = threading.Thread(target=change_room)
+            other.start()
+            other.join()
+
+        with patch('storage_manager.os.fsync', side_effect=fsync):
+            storage.save()
+        self.assertEqual(acquired, [True])
+
+    def test_failed_save_keeps_changes_dirty(self):
+        self.write({})
+        storage = StorageManager(fileLocation=self.path)
+        storage.add_room("r1", "Room 1")
+        with patch('storage_manager.open', side_effect=OSError("disk full"), create=True):
+            with self.assertRaises(OSError):
+                storage.save()
+        storage.save()
+        self.assertIsNotNone(StorageManager(fileLocation=self.path).get_room("r1"))
+
+if __name__ == '__main__':
+    unittest.main()
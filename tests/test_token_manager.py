@@ -0,0 +1,88 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_manager import TokenManager
+
+
+class TestTokenManager(unittest.TestCase):
+    def test_normalize_turns_expires_in_into_absolute_expiry(self):
+        record = TokenManager.normalize(
+            {"access_token": "a", "refresh_token": "r", "expires_in": 3600, "refresh_token_expires_in": 7200},
+            now=1000.0
+        )
+        self.assertEqual(record["access_token"], "a")
+        self.assertEqual(record["refresh_token"], "r")
+        self.assertNotIn("expires_in", record)
+        holder = {"oauth_tokens": TokenManager.normalize({"access_token": "a", "expires_in": 3600})}
+        self.assertAlmostEqual(TokenManager.expires_in(holder), 3600, delta=5)
+
+    def test_refresh_without_new_refresh_token_keeps_the_current_one(self):
+        refresh = MagicMock(return_value={"access_token": "a2", "expires_in": 3600})
+        manager = TokenManager(refresh_function=refresh)
+        holder = {}
+        manager.store(holder, {"access_token": "a1", "refresh_token": "r1", "expires_in": 0,
+                               "refresh_token_expires_in": 7200})
+        refresh_expiry = holder["oauth_tokens"]["refresh_token_expires_at"]
+        self.assertEqual(manager.refresh("org", holder), "a2")
+        self.assertEqual(holder["oauth_tokens"]["refresh_token"], "r1")
+        self.assertEqual(holder["oauth_tokens"]["refresh_token_expires_at"], refresh_expiry)
+        # The kept refresh token still works for the next refresh
+        manager.refresh("org", holder, stale_token="a2")
+        refresh.assert_called_with(refresh_token="r1")
+
+    def test_valid_token_is_not_refreshed(self):
+        refresh = MagicMock()
+        manager = TokenManager(refresh_function=refresh)
+        holder = {}
+        manager.store(holder, {"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+        self.assertEqual(manager.get_access_token("org", holder), "a")
+        refresh.assert_not_called()
+
+    def test_concurrent_refreshes_are_coalesced(self):
+        calls = []
+
+        def refresh(refresh_token):
+            calls.append(refresh_token)
+            time.sleep(0.05)
+            return {"access_token": "new", "refresh_token": "r2", "expires_in": 3600}
+
+        save = MagicMock()
+        manager = TokenManager(refresh_function=refresh, save_function=save)
+        holder = {}
+        manager.store(holder, {"access_token": "old", "refresh_token": "r", "expires_in": -1})
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(manager.get_access_token("org", holder)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, ["r"])
+        self.assertEqual(results, ["new"] * 5)
+        self.assertEqual(holder["oauth_tokens"]["refresh_token"], "r2")
+        save.assert_called_once()
+
+    def test_refresh_due_only_refreshes_tokens_within_margin(self):
+        refresh = MagicMock(return_value={"access_token": "new", "refresh_token": "r", "expires_in": 3600})
+        manager = TokenManager(refresh_function=refresh, refresh_margin=600)
+        fresh, due = {}, {}
+        manager.store(fresh, {"access_token": "a", "refresh_token": "r", "expires_in": 3600})
+        manager.store(due, {"access_token": "b", "refresh_token": "r", "expires_in": 60})
+        manager.refresh_due([("fresh", fresh), ("due", due)])
+        refresh.assert_called_once_with(refresh_token="r")
+        self.assertEqual(due["oauth_tokens"]["access_token"], "new")
+        self.assertEqual(fresh["oauth_tokens"]["access_token"], "a")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,373 @@
+import asyncio
+import json
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# test_bot_logic replaces these modules with mocks, make sure we test the real ones
+for module_name in ('helper', 'webex_admin'):
+    if isinstance(sys.modules.get(module_name), MagicMock):
+        del sys.modules[module_name]
+
+import helper
+import webex_admin
+from rate_limiter import RateLimiter
+from webex_admin import AsyncWebexAdmin, WebexAdminError
+
+
+class StubResponse:
+    """Stands in for an aiohttp response."""
+
+    def __init__(self, status=200, body=None, headers=None, content_type="application/json"):
+        self.status = status
+        self.content_type = content_type
+        self.headers = {"Content-Type": content_type, **(headers or {})}
+        self._body = body if isinstance(body, bytes) else json.dumps(body if body is not None else {}).encode()
+
+    async def read(self):
+        return self._body
+
+
+class StubSession:
+    """Stands in for the shared aiohttp session, answering requests through `handler(method, url)`."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        session = self
+
+        class Context:
+            async def __aenter__(self):
+                response = session.handler(method, url)
+                if asyncio.iscoroutine(response):
+                    response = await response
+                return response
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+        return Context()
+
+
+def page(items, next_url=None):
+    headers = {"Link": f'<{next_url}>; rel="next"'} if next_url else {}
+    return StubResponse(body={"items": items}, headers=headers)
+
+
+class TestDeviceGrouping(unittest.TestCase):
+    def test_group_devices_by_workspace(self):
+        devices = [{"id": "d1", "workspaceId": "w1"}, {"id": "d2"}, {"id": "d3", "workspaceId": "w1"},
+                   {"id": "d4", "workspaceId": "w2"}]
+        grouped = webex_admin.group_devices_by_workspace(devices)
+        self.assertEqual({w: [d["id"] for d in ds] for w, ds in grouped.items()}, {"w1": ["d1", "d3"], "w2": ["d4"]})
+
+
+class AsyncWebexAdminTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.admin = AsyncWebexAdmin(my_token="fake_token")
+        self.admin.org_id = "org1"
+        webex_admin.invalidate_workspaces("org1")
+        # A fresh limiter per test, so earlier tests don't use up the budget
+        self.limiter = RateLimiter()
+        limiter_patch = patch('webex_admin.rate_limiter', self.limiter)
+        limiter_patch.start()
+        self.addCleanup(limiter_patch.stop)
+
+    def serve(self, handler) -> StubSession:
+        """Answer the admin's requests through `handler(method, url)` for the rest of the test."""
+        session = StubSession(handler)
+        session_patch = patch('webex_admin.get_session', return_value=session)
+        session_patch.start()
+        self.addCleanup(session_patch.stop)
+        return session
+
+
+class TestAsyncWebexAdminResponses(AsyncWebexAdminTestCase):
+    async def test_error_status_keeps_message(self):
+        self.serve(lambda method, url: StubResponse(status=401, body={"message": "Unauthorized"}))
+        result = await self.admin._request("GET", "url")
+        self.assertFalse(result.ok)
+        self.assertEqual(result.status, 401)
+        self.assertIn("Unauthorized", result.error)
+
+    async def test_non_json_content_type_is_an_error(self):
+        self.serve(lambda method, url: StubResponse(body=b"<html></html>", content_type="text/html"))
+        result = await self.admin._request("GET", "url")
+        self.assertFalse(result.ok)
+        self.assertIsNone(result.data)
+
+    async def test_json_body_decoded_once(self):
+        self.serve(lambda method, url: StubResponse(body={"id": "w1"}, content_type="application/json; charset=utf-8"))
+        with patch('helper.json_loads', wraps=helper.json_loads) as json_loads:
+            result = await self.admin._request("GET", "url")
+        self.assertTrue(result.ok)
+        self.assertEqual(result.data, {"id": "w1"})
+        json_loads.assert_called_once()
+
+    async def test_payload_is_sent_as_json(self):
+        session = self.serve(lambda method, url: StubResponse(body={"id": "w1"}))
+        await self.admin._request("POST", "url", {"displayName": "Room"})
+        method, _, kwargs = session.requests[0]
+        self.assertEqual(method, "POST")
+        self.assertEqual(json.loads(kwargs["data"]), {"displayName": "Room"})
+        self.assertEqual(kwargs["headers"]["Authorization"], "Bearer fake_token")
+
+    def test_results_do_not_share_headers(self):
+        self.assertIsNone(helper.ApiResult(200).headers)
+
+
+class TestAsyncWebexAdminPagination(AsyncWebexAdminTestCase):
+    async def test_iter_items_follows_link_header(self):
+        pages = {
+            "page1": page([{"id": "w1"}], next_url="page2"),
+            "page2": page([{"id": "w2"}], next_url="page3"),
+            "page3": page([{"id": "w3"}]),
+        }
+        session = self.serve(lambda method, url: pages[url])
+        items = [item async for item in self.admin._iter_items("page1")]
+        self.assertEqual([item["id"] for item in items], ["w1", "w2", "w3"])
+        self.assertEqual([url for _, url, _ in session.requests], ["page1", "page2", "page3"])
+
+    async def test_next_page_is_requested_before_current_page_is_consumed(self):
+        session = self.serve(lambda method, url: page([{"id": url}], next_url="page2" if url == "page1" else None))
+        pages = self.admin._iter_pages("page1")
+        self.assertEqual(await anext(pages), [{"id": "page1"}])
+        await asyncio.sleep(0)
+        self.assertEqual([url for _, url, _ in session.requests], ["page1", "page2"])
+        self.assertEqual([items async for items in pages], [[{"id": "page2"}]])
+
+    async def test_prefetch_is_cancelled_when_closed_early(self):
+        cancelled = asyncio.Event()
+
+        async def handler(method, url):
+            if url == "page1":
+                return page([{"id": "w1"}], next_url="page2")
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        session = self.serve(handler)
+        pages = self.admin._iter_pages("page1")
+        await anext(pages)
+        await asyncio.sleep(0)
+        self.assertEqual(len(session.requests), 2)
+        await pages.aclose()
+        # The prefetch has been cancelled and awaited by the time aclose returns
+        self.assertTrue(cancelled.is_set())
+
+    async def test_error_on_middle_page_is_raised(self):
+        pages = {
+            "page1": page([{"id": "w1"}], next_url="page2"),
+            "page2": StubResponse(status=500, body={"message": "Internal error"}),
+            "page3": page([{"id": "w3"}]),
+        }
+        session = self.serve(lambda method, url: pages[url])
+        items = []
+        with self.assertRaises(WebexAdminError):
+            async for item in self.admin._iter_items("page1"):
+                items.append(item)
+        self.assertEqual(items, [{"id": "w1"}])
+        self.assertNotIn("page3", [url for _, url, _ in session.requests])
+
+    async def test_partial_device_inventory_is_not_counted(self):
+        def handler(method, url):
+            if "/workspaces" in url:
+                return page([{"id": "w1", "displayName": "Room 1"}])
+            if "cursor" not in url:
+                return page([{"workspaceId": "w1"}], next_url=f"{url}&cursor=2")
+            return StubResponse(status=502, body={"message": "Bad gateway"})
+
+        self.serve(handler)
+        self.assertIsNone(await self.admin.count_devices_by_workspace())
+        # Names only, rather than device counts that look complete
+        self.assertEqual(await self.admin.list_workspaces_with_devices(), {"w1": "Room 1"})
+
+    async def test_count_devices_by_workspace(self):
+        session = self.serve(lambda method, url: page([
+            {"workspaceId": "w1"}, {"workspaceId": "w1"}, {"workspaceId": "w2"}, {"id": "no-workspace"}
+        ]))
+        counts = await self.admin.count_devices_by_workspace(page_size=50)
+        self.assertEqual(counts, {"w1": 2, "w2": 1})
+        url = session.requests[0][1]
+        self.assertIn("orgId=org1", url)
+        self.assertIn("max=50", url)
+
+    async def test_429_is_retried_after_retry_after(self):
+        responses = [
+            StubResponse(status=429, body={"message": "Too Many Requests"}, headers={"Retry-After": "0"}),
+            page([{"id": "w1"}]),
+        ]
+        self.serve(lambda method, url: responses.pop(0))
+        result = await self.admin._request("GET", "page1")
+        self.assertTrue(result.ok)
+        self.assertEqual(self.limiter.stats()["org:org1"]["throttles"], 1)
+
+    async def test_429_holds_the_org_for_retry_after_and_retries(self):
+        responses = [
+            StubResponse(status=429, body={"message": "Too Many Requests"}, headers={"Retry-After": "30"}),
+            page([{"id": "w1"}]),
+        ]
+        session = self.serve(lambda method, url: responses.pop(0))
+        with patch('rate_limiter.asyncio.sleep') as sleep:
+            result = await self.admin._request("GET", "page1")
+        self.assertTrue(result.ok)
+        self.assertEqual(len(session.requests), 2)
+        # The retry waited out the Retry-After interval, and so will the org's next request
+        sleep.assert_awaited_once()
+        self.assertAlmostEqual(sleep.await_args.args[0], 30, delta=1)
+        self.assertAlmostEqual(self.limiter.stats()["org:org1"]["throttled_for"], 30, delta=1)
+
+
+
+class TestWorkspaceDirectoryCache(AsyncWebexAdminTestCase):
+    def setUp(self):
+        super().setUp()
+        self.remote = {"w1": "Lobby"}
+
+        def handler(method, url):
+            if method == "POST":
+                self.remote["w2"] = "Office"
+                return StubResponse(body={"id": "w2", "displayName": "Office"})
+            return page([{"id": id, "displayName": name} for id, name in self.remote.items()])
+
+        self.session = self.serve(handler)
+
+    def listings(self) -> int:
+        return sum(1 for method, _, _ in self.session.requests if method == "GET")
+
+    async def test_directory_is_listed_once(self):
+        self.assertEqual(await self.admin.list_workspaces(), {"w1": "Lobby"})
+        self.assertEqual(await self.admin.list_workspaces(), {"w1": "Lobby"})
+        self.assertEqual(self.listings(), 1)
+
+    async def test_created_workspace_is_written_through(self):
+        await self.admin.list_workspaces()
+        self.assertEqual(await self.admin.create_workspace("Office"), "w2")
+        self.assertEqual(await self.admin.list_workspaces(), {"w1": "Lobby", "w2": "Office"})
+        self.assertEqual(self.listings(), 1)
+
+    async def test_directory_expires(self):
+        await self.admin.list_workspaces()
+        with patch('cache.time.monotonic', return_value=time.monotonic() + 3600):
+            await self.admin.list_workspaces()
+        self.assertEqual(self.listings(), 2)
+
+    async def test_refresh_bypasses_the_cached_directory(self):
+        await self.admin.list_workspaces()
+        self.remote["w3"] = "Annex"
+        self.assertEqual(await self.admin.list_workspaces(refresh=True), {"w1": "Lobby", "w3": "Annex"})
+        self.assertEqual(await self.admin.list_workspaces(), {"w1": "Lobby", "w3": "Annex"})
+        self.assertEqual(self.listings(), 2)
+
+    async def test_get_workspace_id_refreshes_on_a_miss(self):
+        self.assertEqual(await self.admin.get_workspace_id("Lobby"), "w1")
+        # Created outside the bot after the directory was cached
+        self.remote["w3"] = "Annex"
+        self.assertEqual(await self.admin.get_workspace_id("Annex"), "w3")
+        self.assertEqual(self.listings(), 2)
+        self.assertEqual(await self.admin.get_workspace_id("Unknown"), "")
+
+
+class TestAsyncWebexAdminTokenRefresh(AsyncWebexAdminTestCase):
+    async def test_rejected_token_is_refreshed_and_retried_once(self):
+        responses = [StubResponse(status=401, body={"message": "Unauthorized"}), StubResponse(body={"code": "1234"})]
+        session = self.serve(lambda method, url: responses.pop(0))
+        self.admin.token_refresher = MagicMock(return_value="fresh_token")
+        result = await self.admin._request_with_refresh("POST", "url", {"workspaceId": "w1"})
+        self.assertTrue(result.ok)
+        self.admin.token_refresher.assert_called_once_with()
+        self.assertEqual(len(session.requests), 2)
+        self.assertEqual(session.requests[1][2]["headers"]["Authorization"], "Bearer fresh_token")
+        self.assertEqual(self.admin.my_token, "fresh_token")
+
+    async def test_still_rejected_after_refresh_is_not_retried_again(self):
+        session = self.serve(lambda method, url: StubResponse(status=403, body={"message": "Forbidden"}))
+        self.admin.token_refresher = MagicMock(return_value="fresh_token")
+        result = await self.admin._request_with_refresh("GET", "url")
+        self.assertEqual(result.status, 403)
+        self.admin.token_refresher.assert_called_once_with()
+        self.assertEqual(len(session.requests), 2)
+
+    async def test_no_activation_code_request_without_workspace(self):
+        session = self.serve(lambda method, url: StubResponse(status=400, body={"message": "Bad request"}))
+        self.assertEqual(await self.admin.get_activation_code("New room", ""), "")
+        # Only the failed workspace creation, no activation code request for an empty workspace
+        self.assertEqual([url for _, url, _ in session.requests], [f"{webex_admin.WEBEX_API_URL}/workspaces"])
+
+
+class TestAsyncWebexAdminCreate(AsyncWebexAdminTestCase):
+    async def test_create_loads_identity(self):
+        def handler(method, url):
+            if url.endswith("/people/me"):
+                return StubResponse(body={"id": "p1", "orgId": "org2", "emails": ["admin@example.com"],
+                                          "displayName": "Admin"})
+            return StubResponse(body={"displayName": "Example Org"})
+
+        session = self.serve(handler)
+        admin = await AsyncWebexAdmin.create("fake_token")
+        self.assertEqual((admin.my_id, admin.org_id, admin.my_email, admin.name, admin.org_name),
+                         ("p1", "org2", "admin@example.com", "Admin", "Example Org"))
+        self.assertEqual(session.requests[1][1], f"{webex_admin.WEBEX_API_URL}/organizations/org2")
+
+    async def test_invalid_token_leaves_identity_empty(self):
+        self.serve(lambda method, url: StubResponse(status=401, body={"message": "Unauthorized"}))
+        admin = await AsyncWebexAdmin.create("bad_token")
+        self.assertEqual((admin.my_id, admin.org_id), ("", ""))
+
+
+class TestSharedSession(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+        self.authorizations = []
+
+        async def me(request):
+            self.authorizations.append(request.headers["Authorization"])
+            return web.json_response({"id": "p1", "orgId": "org1", "emails": ["admin@example.com"],
+                                      "displayName": "Admin"})
+
+        async def organization(request):
+            return web.json_response({"displayName": "Org " + request.match_info["org_id"]})
+
+        app = web.Application()
+        app.router.add_get("/v1/people/me", me)
+        app.router.add_get("/v1/organizations/{org_id}", organization)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.addAsyncCleanup(self.server.close)
+        self.addAsyncCleanup(webex_admin.close_session)
+        for target, value in (('webex_admin.WEBEX_API_URL', str(self.server.make_url("/v1"))),
+                              ('webex_admin.rate_limiter', RateLimiter())):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_admins_share_one_session(self):
+        first = await AsyncWebexAdmin.create("token1")
+        session = webex_admin.get_session()
+        second = await AsyncWebexAdmin.create("token2")
+        self.assertIs(webex_admin.get_session(), session)
+        self.assertFalse(session.closed)
+        self.assertEqual((first.org_name, second.org_name), ("Org org1", "Org org1"))
+        # Each client still sends its own token over the shared pool
+        self.assertEqual(self.authorizations, ["Bearer token1", "Bearer token2"])
+
+    async def test_closed_session_is_replaced(self):
+        session = webex_admin.get_session()
+        await webex_admin.close_session()
+        self.assertTrue(session.closed)
+        admin = await AsyncWebexAdmin.create("token1")
+        self.assertEqual(admin.my_id, "p1")
+        self.assertIsNot(webex_admin.get_session(), session)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import base64
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# test_bot_logic replaces this module with a mock, make sure we test the real one
+if isinstance(sys.modules.get('webex_utils'), MagicMock):
+    del sys.modules['webex_utils']
+
+import webex_utils
+
+
+def rest_id(kind, uuid):
+    return base64.b64encode(f"ciscospark://us/{kind}/{uuid}".encode()).decode().rstrip("=")
+
+
+class TestIdCodec(unittest.TestCase):
+    def test_activity_payload_ids(self):
+        self.assertEqual(webex_utils.activity_id_to_message_id("m-1"), rest_id("MESSAGE", "m-1"))
+        self.assertEqual(webex_utils.activity_id_to_attachment_action_id("a-1"), rest_id("ATTACHMENT_ACTION", "a-1"))
+        self.assertEqual(webex_utils.extract_room_id_from_target({"id": "r-1"}), rest_id("ROOM", "r-1"))
+        self.assertEqual(webex_utils.extract_person_id_from_actor({"id": "p-1"}), rest_id("PEOPLE", "p-1"))
+        self.assertEqual(webex_utils.extract_person_id_from_actor({}), "")
+
+    def test_round_trip_and_bot_id(self):
+        bot_id = rest_id("PEOPLE", "bot-uuid")
+        self.assertEqual(webex_utils.base64_to_uuid(bot_id), "bot-uuid")
+        self.assertTrue(webex_utils.is_bot_id(bot_id, "bot-uuid"))
+        self.assertFalse(webex_utils.is_bot_id(bot_id, "someone-else"))
+
+
+if __name__ == '__main__':
+    unittest.main()
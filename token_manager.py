@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""TokenManager - Keeps OAuth access tokens fresh outside the request path.
+
+This module:
+1. Stores tokens as normalized records with an absolute expiry
+2. Refreshes tokens in the background before they expire
+3. Coalesces concurrent refreshes of the same credentials into one request
+4. Persists refreshed tokens through the provided save function
+
+Tokens live in a "holder" dictionary under the 'oauth_tokens' key, e.g. an
+org entry of the StorageManager.
+"""
+
+import asyncio
+import datetime
+import threading
+import time
+
+
+def _to_timestamp(value) -> float:
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, str) and value:
+        try:
+            return datetime.datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return 0.0
+    return 0.0
+
+
+def _to_iso(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc).isoformat()
+
+
+class TokenManager:
+    """Refreshes and stores OAuth tokens per credential key."""
+
+    def __init__(self, refresh_function, save_function=None, refresh_margin: float = 21600):
+        """Initialize token manager.
+
+        Args:
+            refresh_function: Called with refresh_token=..., returns the raw token response
+            save_function: Called with the credential key after its tokens were refreshed
+            refresh_margin: Refresh tokens this many seconds before they expire
+        """
+        self.refresh_function = refresh_function
+        self.save_function = save_function
+        self.refresh_margin = refresh_margin
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    @staticmethod
+    def normalize(tokens: dict, now: float | None = None) -> dict:
+        """Build a stored token record from a token response or an existing record.
+
+        Relative `expires_in`/`refresh_token_expires_in` values are turned into
+        absolute ISO 8601 `expires_at`/`refresh_token_expires_at` timestamps.
+        """
+        now = time.time() if now is None else now
+        record = {
+            'access_token': tokens.get('access_token', ''),
+            'refresh_token': tokens.get('refresh_token', ''),
+        }
+        if tokens.get('expires_in'):
+            record['expires_at'] = _to_iso(now + int(tokens['expires_in']))
+        else:
+            record['expires_at'] = _to_iso(_to_timestamp(tokens.get('expires_at')))
+        if tokens.get('refresh_token_expires_in'):
+            record['refresh_token_expires_at'] = _to_iso(now + int(tokens['refresh_token_expires_in']))
+        elif tokens.get('refresh_token_expires_at'):
+            record['refresh_token_expires_at'] = _to_iso(_to_timestamp(tokens['refresh_token_expires_at']))
+        return record
+
+    @staticmethod
+    def expires_in(holder: dict) -> float:
+        """Seconds until the holder's access token expires (negative if expired)."""
+        tokens = holder.get('oauth_tokens') or {}
+        return _to_timestamp(tokens.get('expires_at')) - time.time()
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def store(self, holder: dict, tokens: dict) -> dict:
+        """Normalize tokens and put them in the holder.
+
+        A response without a refresh token keeps the holder's current one and its expiry.
+        """
+        record = self.normalize(tokens)
+        previous = holder.get('oauth_tokens') or {}
+        if not record['refresh_token'] and previous.get('refresh_token'):
+            record['refresh_token'] = previous['refresh_token']
+            if previous.get('refresh_token_expires_at'):
+                record['refresh_token_expires_at'] = previous['refresh_token_expires_at']
+        holder['oauth_tokens'] = record
+        return record
+
+    def get_access_token(self, key: str, holder: dict) -> str:
+        """Get a usable access token, refreshing only if it has already expired."""
+        tokens = holder.get('oauth_tokens') or {}
+        access_token = tokens.get('access_token')
+        if access_token and self.expires_in(holder) > 0:
+            return access_token
+        print(f"Access token for {key} missing or expired.")
+        return self.refresh(key, holder, stale_token=access_token)
+
+    def refresh(self, key: str, holder: dict, stale_token: str | None = None) -> str:
+        """Refresh the holder's tokens, once per key at a time.
+
+        Callers that waited on another thread's refresh of `stale_token` get its
+        result instead of refreshing again.
+        """
+        with self._lock_for(key):
+            tokens = holder.get('oauth_tokens') or {}
+            current = tokens.get('access_token')
+            if current and current != stale_token and self.expires_in(holder) > 0:
+                return current
+            refresh_token = tokens.get('refresh_token')
+            if not refresh_token:
+                raise ValueError(f"No refresh token available for {key}")
+            record = self.store(holder, self.refresh_function(refresh_token=refresh_token))
+            print(f"Refreshed access token for {key}")
+        if self.save_function:
+            self.save_function(key)
+        return record['access_token']
+
+    def refresh_due(self, holders) -> None:
+        """Refresh every (key, holder) pair whose token expires within the margin."""
+        for key, holder in holders:
+            tokens = holder.get('oauth_tokens') or {}
+            if not tokens.get('refresh_token') or self.expires_in(holder) > self.refresh_margin:
+                continue
+            try:
+                self.refresh(key, holder, stale_token=tokens.get('access_token'))
+            except Exception as e:
+                print(f"Background token refresh failed for {key}: {e}")
+
+    async def run(self, holders_function, interval: float = 600) -> None:
+        """Periodically refresh tokens close to expiry, off the event loop.
+
+        Args:
+            holders_function: Returns an iterable of (key, holder) pairs to check
+            interval: Seconds between checks
+        """
+        while True:
+            await asyncio.to_thread(self.refresh_due, list(holders_function()))
+            await asyncio.sleep(interval)
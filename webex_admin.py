@@ -1,65 +1,156 @@
 from __future__ import print_function
-import requests
+import asyncio
+import os
 import json
-from webexteamssdk import WebexTeamsAPI, ApiError
+from typing import TYPE_CHECKING
+from cache import TTLCache
 import helper
+from rate_limiter import RateLimiter, parse_retry_after
 
+if TYPE_CHECKING:
+    import aiohttp
 
-class WebexAdmin:
+WEBEX_API_URL = "https://webexapis.com/v1"
+# Devices per page when listing an org's whole inventory
+DEVICE_PAGE_SIZE = 1000
 
-    def __init__(self, my_token: str, use_proxy: bool = False):
+# Request pacing per org (and for the bot token), shared by every admin client
+rate_limiter = RateLimiter(
+    rate=float(os.getenv("WEBEX_RATE_LIMIT", "5")),
+    burst=int(os.getenv("WEBEX_RATE_BURST", "20")),
+    max_retries=int(os.getenv("WEBEX_RATE_RETRIES", "3"))
+)
+
+# One keep-alive connection pool per process, shared by every AsyncWebexAdmin
+_session: "aiohttp.ClientSession | None" = None
+_session_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_session() -> "aiohttp.ClientSession":
+    """Get the shared aiohttp session, creating it on the running loop if needed."""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        # Imported on first use, it is heavy and not needed to start the bot
+        import aiohttp
+        _session_loop = loop
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=60)
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Close the shared aiohttp session."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+# Workspace id -> display name per org, shared by every admin client of that org
+_workspace_directories = TTLCache(ttl=float(os.getenv("WORKSPACE_CACHE_TTL", "300")))
+
+
+def cached_workspaces(org_id: str) -> dict | None:
+    """Get a copy of the org's cached workspace directory, or None if missing or expired."""
+    directory = _workspace_directories.get(org_id)
+    return dict(directory) if directory is not None else None
+
+
+def cache_workspaces(org_id: str, workspaces: dict) -> None:
+    """Replace the org's workspace directory."""
+    # An empty listing is more likely a failed fetch than an empty org, don't keep it
+    if org_id and workspaces:
+        _workspace_directories.set(org_id, dict(workspaces))
+
+
+def cache_new_workspace(org_id: str, workspace_id: str, workspace_name: str) -> None:
+    """Write a newly created workspace through to the org's directory, if one is cached."""
+    directory = _workspace_directories.get(org_id)
+    if directory is not None:
+        # Copy on write, readers on other threads may be iterating the current dict
+        _workspace_directories.replace(org_id, {**directory, workspace_id: workspace_name})
+
+
+def invalidate_workspaces(org_id: str) -> None:
+    """Drop the org's workspace directory so the next listing fetches it again."""
+    _workspace_directories.pop(org_id)
+
+
+def next_page_url(links: str | None) -> str | None:
+    """Get the rel="next" URL out of a Link header."""
+    if not links:
+        return None
+    for part in links.split(","):
+        if 'rel="next"' in part:
+            return part.split(";")[0].strip("<> ")
+    return None
+
+
+def group_devices_by_workspace(devices: list) -> dict:
+    """Group a device inventory into workspace id -> list of devices."""
+    grouped = {}
+    for device in devices:
+        workspace_id = device.get("workspaceId")
+        if workspace_id:
+            grouped.setdefault(workspace_id, []).append(device)
+    return grouped
+
+
+def count_devices_by_workspace(pages, counts: dict | None = None) -> dict:
+    """Count devices per workspace id from an iterable of device pages, keeping only the counts.
+
+    Counts are added to `counts` if given, so pages can be counted as they arrive.
+    """
+    counts = {} if counts is None else counts
+    for page in pages:
+        for device in page:
+            workspace_id = device.get("workspaceId")
+            if workspace_id:
+                counts[workspace_id] = counts.get(workspace_id, 0) + 1
+    return counts
+
+
+def workspaces_with_device_counts(workspaces: dict, counts: dict) -> dict:
+    """Label each workspace name with the number of devices in it."""
+    result = {}
+    for workspace_id, workspace_name in workspaces.items():
+        count = counts.get(workspace_id, 0)
+        result[workspace_id] = f"{workspace_name} ({count} device{'s' if count != 1 else ''})"
+    return result
+
+
+class WebexAdminError(Exception):
+    """A Webex admin API request failed, e.g. a page of a collection."""
+
+
+class AsyncWebexAdmin:
+    """Webex admin API client using the shared aiohttp connection pool.
+
+    Use `await AsyncWebexAdmin.create(token)` to get an instance with identity loaded.
+    """
+
+    def __init__(self, my_token: str, use_proxy: bool = False, token_refresher=None):
         self.my_token = my_token
+        # Called without arguments (on a worker thread) to get a fresh access token after a 401/403
+        self.token_refresher = token_refresher
         self.use_proxy = use_proxy
-        self.proxies = {
-            'http': 'http://127.0.0.1:8080',
-            'https': 'http://127.0.0.1:8080'
-        } if use_proxy else None
-        self.api = WebexTeamsAPI(access_token=self.my_token)
+        self.proxy = 'http://127.0.0.1:8080' if use_proxy else None
         self.headers = self.get_headers()
-        
+
         self.org_id = ""
         self.my_id = ""
-        
-        try:
-            me = self.api.people.me()
-            self.my_email = me.emails[0] if me.emails else ""
-            self.name = me.displayName
-            self.my_id = me.id
-            self.org_id = me.orgId
-            self.org_name = self._get_org_name()
-        except ApiError:
-            print('Invalid token provided.')
-            pass
-
-    def _get_org_name(self) -> str:
-        self.api.organizations.get(self.org_id)
-        return self.api.organizations.get(self.org_id).displayName
-
-    def token_is_valid(self):
-        try:
-            response = requests.get(
-                url=f'https://webexapis.com/v1/workspaces?orgId={self.org_id}',
-                headers=self.headers,
-                proxies=self.proxies,
-                verify=not self.use_proxy
-            )
-            if response.status_code / 100 != 2:
-                return False
-            return True
-        except Exception:
-            return False
-    
-    def update_token(self, token):
-        self.my_token = token
-        self.headers = self.get_headers()
-        self.api = WebexTeamsAPI(access_token=self.my_token)
-        try:
-            self.my_id = self.api.people.me().id
-            self.org_id = self._get_org_id()
-        except ApiError:
-            self.my_id = ""
-            self.org_id = ""
-        return self.my_id
+        self.my_email = ""
+        self.name = ""
+        self.org_name = ""
+
+    @classmethod
+    async def create(cls, my_token: str, use_proxy: bool = False, token_refresher=None) -> "AsyncWebexAdmin":
+        admin = cls(my_token, use_proxy, token_refresher)
+        await admin.load_identity()
+        return admin
 
     def get_headers(self) -> dict:
         return {
@@ -68,170 +159,227 @@ class WebexAdmin:
             "Accept": "application/json"
         }
 
-    def _get_all_items(self, url):
-        items = []
-        while url:
-            try:
-                response = requests.get(
-                    url=url,
-                    headers=self.headers,
-                    proxies=self.proxies,
-                    verify=not self.use_proxy
-                )
-                if helper.is_json(response) and "items" in response.json().keys():
-                    items.extend(response.json()["items"])
-
-                    # Check for Link header for pagination
-                    links = response.headers.get("Link")
-                    next_url = None
-                    if links:
-                        parts = links.split(",")
-                        for part in parts:
-                            if 'rel="next"' in part:
-                                next_url = part.split(";")[0].strip("<> ")
-                                break
-                    url = next_url
-                else:
-                    print(f"Something went wrong. Response: {helper.load_text(response)}")
-                    break
-            except Exception as e:
-                print(f"Error fetching items: {e}")
+    def set_token(self, token: str) -> None:
+        """Switch to a refreshed access token of the same org."""
+        self.my_token = token
+        self.headers = self.get_headers()
+
+    @property
+    def rate_key(self) -> str:
+        return f"org:{self.org_id or 'pending'}"
+
+    async def _request(self, method: str, url: str, payload: dict | None = None) -> helper.ApiResult:
+        """Send a request and decode the response once, waiting out rate limits."""
+        for attempt in range(rate_limiter.max_retries + 1):
+            await rate_limiter.acquire_async(self.rate_key)
+            async with get_session().request(
+                method,
+                url,
+                data=json.dumps(payload) if payload is not None else None,
+                headers=self.headers,
+                proxy=self.proxy,
+                ssl=False if self.use_proxy else None
+            ) as response:
+                body = await response.read()
+                result = helper.parse_response(response.status, response.content_type, body, response.headers)
+            if result.status != 429:
                 break
-        return items
+            rate_limiter.throttled(self.rate_key, parse_retry_after(result.headers))
+        return result
+
+    async def _request_with_refresh(self, method: str, url: str, payload: dict | None = None) -> helper.ApiResult:
+        """Send a request, refreshing the token and retrying once if it is rejected."""
+        result = await self._request(method, url, payload)
+        if result.status in (401, 403) and self.token_refresher:
+            print(f"Token rejected with {result.status}, refreshing and retrying.")
+            token = await asyncio.to_thread(self.token_refresher)
+            if token and token != self.my_token:
+                self.set_token(token)
+                result = await self._request(method, url, payload)
+        return result
+
+    async def load_identity(self) -> None:
+        try:
+            result = await self._request("GET", f"{WEBEX_API_URL}/people/me")
+            if not result.ok:
+                print(f'Invalid token provided: {result.error}')
+                return
+            me = result.data
+            self.my_email = me["emails"][0] if me.get("emails") else ""
+            self.name = me.get("displayName", "")
+            self.my_id = me.get("id", "")
+            self.org_id = me.get("orgId", "")
+            result = await self._request("GET", f"{WEBEX_API_URL}/organizations/{self.org_id}")
+            self.org_name = result.data.get("displayName", "") if result.ok else ""
+        except Exception as e:
+            print(f'Invalid token provided: {e}')
+
+    async def token_is_valid(self) -> bool:
+        try:
+            result = await self._request("GET", f"{WEBEX_API_URL}/workspaces?orgId={self.org_id}")
+            return result.status // 100 == 2
+        except Exception:
+            return False
+
+    async def _fetch_page(self, url) -> tuple[list, str | None]:
+        """Fetch one page of a collection.
+
+        Returns:
+            Tuple of the page items and the next page URL
+
+        Raises:
+            WebexAdminError: If the page could not be fetched
+        """
+        try:
+            result = await self._request("GET", url)
+        except Exception as e:
+            raise WebexAdminError(f"Error fetching items: {e}") from e
+        if result.ok and "items" in result.data:
+            return result.data["items"], next_page_url((result.headers or {}).get("Link"))
+        raise WebexAdminError(f"Something went wrong. Response: {result.error or result.data}")
+
+    async def _iter_pages(self, url):
+        """Yield the items of each page, fetching the next page while the current one is consumed.
 
-    def create_workspace(self, workspace_name) -> str:
+        Raises:
+            WebexAdminError: If a page could not be fetched, after the pages before it were yielded
+        """
+        if not url:
+            return
+        pending = None
+        try:
+            page = await self._fetch_page(url)
+            while True:
+                items, next_url = page
+                pending = asyncio.ensure_future(self._fetch_page(next_url)) if next_url else None
+                yield items
+                if pending is None:
+                    return
+                page = await pending
+        finally:
+            # Closed early, don't leave the prefetch running behind the caller
+            if pending and not pending.done():
+                pending.cancel()
+                await asyncio.wait([pending])
+
+    async def _iter_items(self, url):
+        """Yield the items of a collection one by one, holding about one page in memory."""
+        async for page in self._iter_pages(url):
+            for item in page:
+                yield item
+
+    async def _get_all_items(self, url) -> list:
+        return [item async for item in self._iter_items(url)]
+
+    async def create_workspace(self, workspace_name) -> str:
         if not self.org_id:
             return ""
-        
+
         print(f"Creating workspace {workspace_name}.")
         payload = {
             "displayName": workspace_name,
             "orgId": self.org_id
         }
         try:
-            response = requests.post(
-                url="https://webexapis.com/v1/workspaces",
-                data=json.dumps(payload),
-                headers=self.headers,
-                proxies=self.proxies,
-                verify=not self.use_proxy
-            )
+            result = await self._request_with_refresh("POST", f"{WEBEX_API_URL}/workspaces", payload)
         except Exception:
             return ""
-        
-        if helper.is_json(response):
-            workspace_id = json.loads(response.content)["id"]
-        else:
-            print(f"Something went wrong. Response: {helper.load_text(response)}")
-            return ""
-        
-        return workspace_id
-
-    def list_workspaces(self) -> dict:
-        url_workspaces = f'https://webexapis.com/v1/workspaces?orgId={self.org_id}'
-        workspaces = self._get_all_items(url_workspaces)
-        result = {}
-        for workspace in workspaces:
-            ws_id = workspace["id"]
-            name = workspace["displayName"]
-            result[ws_id] = name
-        return result
-    
-    def list_workspaces_with_devices(self) -> dict:
-        counts = {}
-        result = {}
-        workspaces = self.list_workspaces()
-        devices = self.get_all_devices()
-        
-        for device in devices:
-            if "workspaceId" in device and device["workspaceId"] in workspaces:
-                workspace_id = device["workspaceId"]
-                if workspace_id in counts:
-                    counts[workspace_id] += 1
-                else:
-                    counts[workspace_id] = 1
-        for workspace_id, workspace_name in workspaces.items():
-            if workspace_id in counts:
-                result[workspace_id] = f"{workspace_name} ({counts[workspace_id]} device{'s' if counts[workspace_id] != 1 else ''})"
-            else:
-                result[workspace_id] = f"{workspace_name} (0 devices)"
+
+        if result.ok and "id" in result.data:
+            cache_new_workspace(self.org_id, result.data["id"], workspace_name)
+            return result.data["id"]
+        print(f"Something went wrong. Response: {result.error or result.data}")
+        return ""
+
+    async def list_workspaces(self, refresh: bool = False) -> dict:
+        if not refresh:
+            cached = cached_workspaces(self.org_id)
+            if cached is not None:
+                return cached
+        url_workspaces = f'{WEBEX_API_URL}/workspaces?orgId={self.org_id}'
+        try:
+            result = {workspace["id"]: workspace["displayName"] async for workspace in self._iter_items(url_workspaces)}
+        except WebexAdminError as e:
+            # A partial directory would pass for the whole one, neither return nor cache it
+            print(f"Could not list workspaces: {e}")
+            return {}
+        cache_workspaces(self.org_id, result)
         return result
-    
-    def get_activation_code(self, new_workspace_name, existing_workspace_id, model=None) -> str:
-        if not self.token_is_valid():
-            return ""
-        
+
+    async def list_workspaces_with_devices(self) -> dict:
+        workspaces, counts = await asyncio.gather(self.list_workspaces(), self.count_devices_by_workspace())
+        if counts is None:
+            # Better no counts than every workspace showing 0 devices
+            return workspaces
+        return workspaces_with_device_counts(workspaces, counts)
+
+    async def get_activation_code(self, new_workspace_name, existing_workspace_id, model=None) -> str:
         if new_workspace_name:
-            workspace_id = self.create_workspace(new_workspace_name)
+            workspace_id = await self.create_workspace(new_workspace_name)
         else:
             workspace_id = existing_workspace_id
-        
+        if not workspace_id:
+            return ""
+
         payload = {"workspaceId": workspace_id}
-        
+
         try:
-            response = requests.post(
-                url=f"https://webexapis.com/v1/devices/activationCode?orgId={self.org_id}",
-                data=json.dumps(payload),
-                headers=self.headers,
-                proxies=self.proxies,
-                verify=not self.use_proxy
+            result = await self._request_with_refresh(
+                "POST", f"{WEBEX_API_URL}/devices/activationCode?orgId={self.org_id}", payload
             )
         except Exception:
             return ""
-        
-        if helper.is_json(response):
-            activation_code = json.loads(response.content)["code"]
-            return activation_code
-        else:
-            print(f"Something went wrong. Response: {helper.load_text(response)}")
-            return ""
 
-    def get_workspace_id(self, name) -> str:
-        workspaces = self.list_workspaces()
+        if result.ok and "code" in result.data:
+            return result.data["code"]
+        print(f"Something went wrong. Response: {result.error or result.data}")
+        return ""
+
+    async def get_workspace_id(self, name) -> str:
+        workspaces = await self.list_workspaces()
         for id, display_name in workspaces.items():
             if display_name == name:
                 return id
+        # The workspace may have been created outside the bot since the directory was cached
+        for id, display_name in (await self.list_workspaces(refresh=True)).items():
+            if display_name == name:
+                return id
         return ""
 
-    
-    def get_all_devices(self) -> list:
+    async def get_all_devices(self, page_size: int = DEVICE_PAGE_SIZE) -> list | None:
+        if not self.org_id:
+            return None
         try:
-            response = requests.get(
-                url=f'https://webexapis.com/v1/devices',
-                headers=self.headers,   
-                proxies=self.proxies,
-                verify=not self.use_proxy
-            )
-            if helper.is_json(response) and "items" in response.json().keys():
-                return response.json()["items"]
-            else:
-                print(f"Something went wrong. Response: {helper.load_text(response)}")
-                return None
-        except Exception:
+            return await self._get_all_items(f'{WEBEX_API_URL}/devices?orgId={self.org_id}&max={page_size}')
+        except WebexAdminError as e:
+            print(f"Could not list devices: {e}")
             return None
-    
-    def get_devices(self, workspace_id) -> list:
+
+    async def count_devices_by_workspace(self, page_size: int = DEVICE_PAGE_SIZE) -> dict | None:
+        """Count the org's devices per workspace id, one page in memory at a time.
+
+        Returns:
+            Devices per workspace id, or None if the inventory could not be listed completely
+        """
+        counts = {}
         if not self.org_id:
+            return counts
+        try:
+            async for page in self._iter_pages(f'{WEBEX_API_URL}/devices?orgId={self.org_id}&max={page_size}'):
+                count_devices_by_workspace([page], counts)
+        except WebexAdminError as e:
+            print(f"Could not count devices: {e}")
             return None
+        return counts
 
+    async def get_devices(self, workspace_id) -> list | None:
+        if not self.org_id:
+            return None
         try:
-            response = requests.get(
-                url=f'https://webexapis.com/v1/devices?workspaceId={workspace_id}',
-                headers=self.headers,
-                proxies=self.proxies,
-                verify=not self.use_proxy
-            )
+            result = await self._request("GET", f'{WEBEX_API_URL}/devices?workspaceId={workspace_id}')
         except Exception:
             return None
-
-        if helper.is_json(response) and "items" in response.json().keys():
-            return response.json()["items"]
-        else:
-            print(f"Something went wrong. Response: {helper.load_text(response)}")
-            return None
-
-    def save(self):
-        return {
-            "admin_token": self.my_token,
-            "org_id": self.org_id
-        }
+        if result.ok and "items" in result.data:
+            return result.data["items"]
+        print(f"Something went wrong. Response: {result.error or result.data}")
+        return None
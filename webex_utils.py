@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import base64
 from base64 import b64encode
+from functools import lru_cache
 import requests
 
 WDM_DEVICES_URL = "https://wdm-a.wbx2.com/wdm/api/v1/devices"
@@ -43,25 +44,36 @@ def get_device_info(bot_token):
         print(f"Error checking existing devices: {e}")
     return result
 
-def activity_id_to_message_id(activity_id: str) -> str:
-    base_string = f"ciscospark://us/MESSAGE/{activity_id}"
+@lru_cache(maxsize=4096)
+def encode_id(kind: str, uuid: str) -> str:
+    """Build the REST API ID of an object from its type and the UUID used in websocket activities."""
+    base_string = f"ciscospark://us/{kind}/{uuid}"
     return b64encode(base_string.encode("utf-8")).decode("utf-8").rstrip("=")
 
 
+def activity_id_to_message_id(activity_id: str) -> str:
+    return encode_id("MESSAGE", activity_id)
+
+
 def activity_id_to_attachment_action_id(activity_id: str) -> str:
-    base_string = f"ciscospark://us/ATTACHMENT_ACTION/{activity_id}"
-    return b64encode(base_string.encode("utf-8")).decode("utf-8").rstrip("=")
+    return encode_id("ATTACHMENT_ACTION", activity_id)
 
 
 def extract_room_id_from_target(target: dict) -> str:
     target_id = target.get("id", "")
     if not target_id:
         return ""
-    
-    base_string = f"ciscospark://us/ROOM/{target_id}"
-    return b64encode(base_string.encode("utf-8")).decode("utf-8").rstrip("=")
+    return encode_id("ROOM", target_id)
+
+
+def extract_person_id_from_actor(actor: dict) -> str:
+    actor_id = actor.get("id", "")
+    if not actor_id:
+        return ""
+    return encode_id("PEOPLE", actor_id)
 
 
+@lru_cache(maxsize=4096)
 def is_bot_id(bot_id: str, person_id: str) -> bool:
     try:
         decoded = base64.b64decode(bot_id + "==").decode("utf-8")
@@ -73,6 +85,7 @@ def is_bot_id(bot_id: str, person_id: str) -> bool:
     
     return person_id == bot_id
 
+@lru_cache(maxsize=4096)
 def base64_to_uuid(encoded_id: str) -> str:
     try:
         decoded = base64.b64decode(encoded_id + "==").decode("utf-8")